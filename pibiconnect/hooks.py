@@ -131,6 +131,30 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+  "CN Connect Settings": {
+    "on_update": "pibiconnect.pibiconnect.influx_client.on_settings_update"
+  },
+  "CN Device": {
+    "on_update": "pibiconnect.pibiconnect.field_catalog.on_device_update"
+  },
+  "CN Sensor Var": {
+    "on_update": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change",
+    "on_trash": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change",
+    "after_rename": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change"
+  },
+  "CN UOM": {
+    "on_update": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change",
+    "on_trash": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change",
+    "after_rename": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change"
+  },
+  "CN Sensor Type": {
+    "on_update": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change",
+    "on_trash": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change",
+    "after_rename": "pibiconnect.pibiconnect.metadata_cache.on_metadata_change"
+  }
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -153,6 +177,9 @@ scheduler_events = {
     "cron": {
        "*/2 * * * *": [
          "pibiconnect.pibiconnect.collect_influx_data.collect_influx_data"
+       ],
+       "* * * * *": [
+         "pibiconnect.pibiconnect.notification_outbox.dispatch_notifications"
        ]
     }
 }
@@ -0,0 +1,32 @@
+import frappe
+from pibiconnect.pibiconnect.raw_data_codec import decode_raw_data, encode_raw_data, is_encoded
+
+BATCH_SIZE = 1000
+
+def execute():
+  """Re-encode CN Log Item.raw_data rows stored as JSON lists in the compact format"""
+  last_name = ""
+  while True:
+    rows = frappe.db.sql("""
+      SELECT `name`, `raw_data` FROM `tabCN Log Item`
+      WHERE `name` > %s AND `raw_data` IS NOT NULL
+      ORDER BY `name` LIMIT %s
+    """, (last_name, BATCH_SIZE), as_dict=True)
+    if not rows:
+      break
+
+    for row in rows:
+      if is_encoded(row.raw_data):
+        continue
+      try:
+        decoded = decode_raw_data(row.raw_data)
+      except (ValueError, TypeError, KeyError, AttributeError):
+        # Leave unreadable rows untouched, the decoder rejects them the same way
+        continue
+      frappe.db.sql(
+        "UPDATE `tabCN Log Item` SET `raw_data` = %s WHERE `name` = %s",
+        (encode_raw_data(decoded['times'], decoded['values'], decoded['raw_values']), row.name)
+      )
+
+    frappe.db.commit()
+    last_name = rows[-1].name
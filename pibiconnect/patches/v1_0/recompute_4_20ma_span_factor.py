@@ -0,0 +1,9 @@
+import frappe
+
+def execute():
+  """4-20 mA spans were scaled as 0-10 V, recompute their factor over the 16 mA range"""
+  frappe.db.sql("""
+    UPDATE `tabCN Span`
+    SET `span_factor` = (`higher_span` - `lower_span`) / 16
+    WHERE `scale` = '4-20mA' AND (IFNULL(`higher_span`, 0) != 0 OR IFNULL(`lower_span`, 0) != 0)
+  """)
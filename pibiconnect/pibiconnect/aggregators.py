@@ -0,0 +1,128 @@
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+# Aggregators take epoch microsecond timestamps (int64), NaN-free float64 values
+# and an optional parameter, and return the representative value of the window.
+Aggregator = Callable[[np.ndarray, np.ndarray, Optional[float]], float]
+
+DEFAULT_AGGREGATOR = "Recency Weighted"
+# Aggregators that can be derived from the running sums of a pushdown query
+PUSHDOWN_AGGREGATORS = ("Recency Weighted", "Mean")
+
+AGGREGATORS: Dict[str, Aggregator] = {}
+
+def register_aggregator(name: str) -> Callable[[Aggregator], Aggregator]:
+  """Register an aggregator under the name used by CN Sensor Var.aggregator"""
+  def decorator(fn: Aggregator) -> Aggregator:
+    AGGREGATORS[name] = fn
+    return fn
+  return decorator
+
+def get_aggregator(name: Optional[str]) -> Aggregator:
+  """Aggregator registered under `name`, falling back to the default one"""
+  return AGGREGATORS.get(name or DEFAULT_AGGREGATOR) or AGGREGATORS[DEFAULT_AGGREGATOR]
+
+@register_aggregator("Recency Weighted")
+def recency_weighted(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  """Mean weighted by the distance of each point from the start of the window"""
+  if values.size == 1:
+    return float(values[0])
+  offsets = (times - times.min()).astype(np.float64)
+  total = offsets.sum()
+  if total == 0:
+    return float(values.mean())
+  return float(np.dot(values, offsets) / total)
+
+@register_aggregator("Time Weighted")
+def time_weighted(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  """Trapezoidal integral of the signal divided by the window duration"""
+  if values.size == 1:
+    return float(values[0])
+  duration = float(times[-1] - times[0])
+  if duration == 0:
+    return float(values.mean())
+  areas = (values[1:] + values[:-1]) * np.diff(times).astype(np.float64)
+  return float(areas.sum() / (2 * duration))
+
+@register_aggregator("Mean")
+def mean(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  return float(values.mean())
+
+@register_aggregator("Median")
+def median(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  return float(np.median(values))
+
+@register_aggregator("EWMA")
+def ewma(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  """Exponentially weighted moving average seeded with the first value.
+
+  `param` is the smoothing factor in (0, 1], 0.3 when not set.
+  """
+  alpha = float(param) if param and 0 < param <= 1 else 0.3
+  decay = np.power(1 - alpha, np.arange(values.size - 1, -1, -1, dtype=np.float64))
+  weights = alpha * decay
+  weights[0] = decay[0]
+  return float(np.dot(values, weights))
+
+@register_aggregator("Percentile")
+def percentile(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  """`param`-th percentile of the window, 95 when not set"""
+  q = float(param) if param and 0 < param <= 100 else 95.0
+  return float(np.percentile(values, q))
+
+@register_aggregator("Standard Deviation")
+def standard_deviation(times: np.ndarray, values: np.ndarray, param: Optional[float] = None) -> float:
+  return float(values.std())
+
+def window_statistics(times: np.ndarray, values: np.ndarray, aggregator: Optional[str] = None,
+                      param: Optional[float] = None) -> Dict[str, float]:
+  """Representative value, average and extremes of a window of points"""
+  return {
+    'value': get_aggregator(aggregator)(times, values, param),
+    'average': float(values.mean()),
+    'maximum': float(values.max()),
+    'minimum': float(values.min())
+  }
+
+def _python_window_statistics(times, values):
+  """List-based recency-weighted statistics, kept as the benchmark reference"""
+  start_time = min(times)
+  time_diffs = [t - start_time for t in times]
+  max_diff = max(time_diffs)
+  weights = [diff / max_diff for diff in time_diffs]
+  weight_sum = sum(weights)
+  weights = [w / weight_sum for w in weights]
+  return {
+    'value': sum(value * weight for value, weight in zip(values, weights, strict=True)),
+    'average': sum(values) / len(values),
+    'maximum': max(values),
+    'minimum': min(values)
+  }
+
+def benchmark(points: int = 10000, repeat: int = 50) -> Dict[str, float]:
+  """Compare list-based and NumPy window statistics on a synthetic window.
+
+  Run with `bench execute pibiconnect.pibiconnect.aggregators.benchmark`.
+  """
+  rng = np.random.default_rng(0)
+  times = np.cumsum(rng.integers(500000, 1500000, points)).astype(np.int64)
+  values = rng.normal(20.0, 5.0, points)
+  times_list = times.tolist()
+  values_list = values.tolist()
+
+  results = {}
+  started = time.perf_counter()
+  for _ in range(repeat):
+    _python_window_statistics(times_list, values_list)
+  results['python_ms'] = (time.perf_counter() - started) * 1000 / repeat
+
+  for name in AGGREGATORS:
+    started = time.perf_counter()
+    for _ in range(repeat):
+      window_statistics(times, values, name)
+    results[f'{name}_ms'] = (time.perf_counter() - started) * 1000 / repeat
+
+  results['speedup'] = results['python_ms'] / results[f'{DEFAULT_AGGREGATOR}_ms']
+  return results
@@ -0,0 +1,227 @@
+import frappe
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from frappe.utils import get_datetime
+from pibiconnect.pibiconnect.series_cursor import to_epoch_us
+
+logger = logging.getLogger(__name__)
+
+# Redis hash of alert item name -> {alert type: epoch us since which a change is pending}
+DEBOUNCE_KEY = "pibiconnect:alert_debounce"
+
+class AlertRuleTable:
+  """Thresholds of every active CN Alert Item, loaded once per cycle.
+
+  The points of each series are recorded while devices are processed and
+  scanned together at the end of the cycle; only the alert start and finish
+  events, outside their cooldown, are handed back for the database side of
+  alerting.
+
+  An alert starts once its condition has held for the stability span and
+  finishes once the value has stayed back past the threshold, by the
+  hysteresis band, for the stability span. A change still waiting for its
+  stability span at the end of a window is carried over to the next cycle.
+  """
+  def __init__(self, tz_handler):
+    self.tz = tz_handler
+    self._lock = threading.Lock()
+    self._index: Dict[Tuple[str, str], int] = {}
+    self._by_device: Dict[str, List[int]] = {}
+    self._names: List[str] = []
+    self._pending: List[Tuple] = []
+    self._debounce: Dict[str, Dict[str, int]] = {}
+
+  def load(self) -> None:
+    rows = frappe.db.sql("""
+      SELECT
+        alert_item.name, alert_item.parent, alert_item.sensor_var,
+        alert_item.high_value, alert_item.low_value, alert_item.alert_high, alert_item.alert_low,
+        alert_item.active_high, alert_item.active_low, alert_item.alert_cooldown, alert_item.last_alert_time,
+        alert_item.stability_span, alert_item.hysteresis
+      FROM `tabCN Alert Item` AS alert_item
+      INNER JOIN `tabCN Device` AS device ON device.name = alert_item.parent
+      WHERE alert_item.parenttype = 'CN Device' AND alert_item.warning_disabled = 0 AND device.disabled = 0
+      ORDER BY alert_item.parent, alert_item.idx
+    """, as_dict=True)
+
+    self._index = {}
+    self._by_device = {}
+    kept = []
+    for row in rows:
+      key = (row.parent, (row.sensor_var or '').lower())
+      # As with a per-item lookup, the first alert item of a series wins
+      if key in self._index:
+        continue
+      self._index[key] = len(kept)
+      self._by_device.setdefault(row.parent, []).append(len(kept))
+      kept.append(row)
+
+    self._names = [row.name for row in kept]
+    self.high_value = self._floats(row.high_value for row in kept)
+    self.low_value = self._floats(row.low_value for row in kept)
+    self.alert_high = np.array([bool(row.alert_high) for row in kept], dtype=bool)
+    self.alert_low = np.array([bool(row.alert_low) for row in kept], dtype=bool)
+    self.active_high = np.array([bool(row.active_high) for row in kept], dtype=bool)
+    self.active_low = np.array([bool(row.active_low) for row in kept], dtype=bool)
+    self.cooldown_us = np.array([int(row.alert_cooldown or 0) * 1000000 for row in kept], dtype=np.int64)
+    self.stable_us = np.array([max(int(row.stability_span or 0), 0) * 1000000 for row in kept], dtype=np.int64)
+    self.hysteresis = np.array([abs(float(row.hysteresis or 0)) for row in kept], dtype=np.float64)
+    self.last_alert_us = np.array([
+      to_epoch_us(self.tz.system_to_utc(get_datetime(row.last_alert_time))) if row.last_alert_time else -1
+      for row in kept
+    ], dtype=np.int64)
+    self._pending = []
+
+    try:
+      self._debounce = frappe.cache().hgetall(DEBOUNCE_KEY) or {}
+    except Exception as e:
+      logger.error(f"Error loading alert debounce state: {str(e)}")
+      self._debounce = {}
+
+  def has_active(self, device: str) -> bool:
+    """Whether any alert of a device is currently active"""
+    rules = self._by_device.get(device)
+    if not rules:
+      return False
+    return bool(self.active_high[rules].any() or self.active_low[rules].any())
+
+  @staticmethod
+  def _floats(values) -> np.ndarray:
+    return np.array([float(value) if value is not None else np.nan for value in values], dtype=np.float64)
+
+  def record(self, device_doc: 'frappe.model.document.Document', sensor_var: str,
+             times_us: np.ndarray, values: np.ndarray) -> None:
+    """Queue the new points of a series that has an alert item"""
+    idx = self._index.get((device_doc.name, sensor_var.lower()))
+    if idx is None or not len(values):
+      return
+    with self._lock:
+      self._pending.append((
+        idx, device_doc, sensor_var,
+        np.asarray(times_us, dtype=np.int64), np.asarray(values, dtype=np.float64)
+      ))
+
+  @staticmethod
+  def _transitions(times: np.ndarray, enter: np.ndarray, leave: np.ndarray, active: bool,
+                   last_alert_us: int, cooldown_us: int, stable_us: int,
+                   pending_since_us: Optional[int]) -> Tuple[List[Tuple[int, int, bool]], Optional[int]]:
+    """Alert starts and finishes in a series, with the pending change left over.
+
+    `enter` and `leave` tell, per point, whether the condition to start and to
+    finish an alert holds. A change is confirmed at the first point of an
+    unbroken run of its condition that is at least `stable_us` after the start
+    of the run and clear of the cooldown of the previous alert. Events are
+    (position, time, new state), timed at the start of their run unless the
+    cooldown held them back. Runs are located with searchsorted, so the cost is
+    one pass over the points plus a few lookups per event.
+    """
+    size = times.size
+    holds_at = {True: np.flatnonzero(leave), False: np.flatnonzero(enter)}
+    breaks_at = {True: np.flatnonzero(~leave), False: np.flatnonzero(~enter)}
+    events = []
+    pos = 0
+    while pos < size:
+      holds = holds_at[active]
+      breaks = breaks_at[active]
+      if pending_since_us is not None and pos == 0 and holds.size and holds[0] == 0:
+        # The run started in a previous window
+        run_pos, run_start_us = 0, pending_since_us
+      else:
+        nxt = int(np.searchsorted(holds, pos))
+        if nxt >= holds.size:
+          pending_since_us = None
+          break
+        run_pos = int(holds[nxt])
+        run_start_us = int(times[run_pos])
+      pending_since_us = None
+
+      brk = int(np.searchsorted(breaks, run_pos))
+      run_end = int(breaks[brk]) if brk < breaks.size else size
+
+      cooldown_end_us = last_alert_us + cooldown_us if last_alert_us >= 0 and cooldown_us else run_start_us
+      confirm_us = max(run_start_us + stable_us, cooldown_end_us)
+      confirm_pos = max(int(np.searchsorted(times, confirm_us)), run_pos)
+      if confirm_pos >= run_end:
+        if run_end == size:
+          pending_since_us = run_start_us
+          break
+        pos = run_end
+        continue
+
+      event_us = run_start_us if cooldown_end_us <= run_start_us else int(times[confirm_pos])
+      active = not active
+      last_alert_us = event_us
+      events.append((confirm_pos if event_us != run_start_us else run_pos, event_us, active))
+      pos = confirm_pos + 1
+    return events, pending_since_us
+
+  def evaluate(self) -> List[Dict]:
+    """Alert start and finish events in the points recorded this cycle.
+
+    Every confirmed high/low crossing is found with array operations over the
+    raw points and reported at the exact time of the crossing, in time order
+    per alert item, with the device document, the sensor var and the value.
+    """
+    with self._lock:
+      pending, self._pending = self._pending, []
+
+    events = []
+    debounce_changes = {}
+    for rule, device_doc, sensor_var, times, values in pending:
+      name = self._names[rule]
+      debounce = dict(self._debounce.get(name) or {})
+      item_events = []
+      high = self.high_value[rule]
+      low = self.low_value[rule]
+      band = self.hysteresis[rule]
+      for alert_type, enabled, threshold, enter, leave, active in (
+        ('high', self.alert_high[rule], high, values >= high, values < high - band, self.active_high),
+        ('low', self.alert_low[rule], low, values <= low, values > low + band, self.active_low)
+      ):
+        if not enabled or np.isnan(threshold):
+          continue
+        transitions, pending_since = self._transitions(
+          times, enter, leave, bool(active[rule]), int(self.last_alert_us[rule]),
+          int(self.cooldown_us[rule]), int(self.stable_us[rule]), debounce.get(alert_type)
+        )
+        debounce[alert_type] = pending_since
+        for pos, time_us, started in transitions:
+          item_events.append((time_us, alert_type, started, float(threshold), float(values[pos])))
+        if transitions:
+          # Keep the table in step in case it is evaluated again before reloading
+          active[rule] = transitions[-1][2]
+
+      debounce = {key: value for key, value in debounce.items() if value is not None}
+      if debounce != (self._debounce.get(name) or {}):
+        self._debounce[name] = debounce
+        debounce_changes[name] = debounce
+
+      item_events.sort(key=lambda event: event[0])
+      if item_events:
+        self.last_alert_us[rule] = max(self.last_alert_us[rule], item_events[-1][0])
+      for time_us, alert_type, started, threshold, value in item_events:
+        events.append({
+          'alert_item': name,
+          'device_doc': device_doc,
+          'sensor_var': sensor_var,
+          'time_us': time_us,
+          'value': value,
+          'changes': [(alert_type, 'start' if started else 'finish', threshold)]
+        })
+
+    self._save_debounce(debounce_changes)
+    return events
+
+  def _save_debounce(self, changes: Dict[str, Dict[str, int]]) -> None:
+    """Persist the pending changes of the alert items evaluated this cycle"""
+    try:
+      for name, debounce in changes.items():
+        if debounce:
+          frappe.cache().hset(DEBOUNCE_KEY, name, debounce)
+        else:
+          frappe.cache().hdel(DEBOUNCE_KEY, name)
+    except Exception as e:
+      logger.error(f"Error saving alert debounce state: {str(e)}")
@@ -6,6 +6,11 @@ from frappe.utils import now_datetime, today, cstr
 from frappe.utils.background_jobs import enqueue
 from frappe.utils import getdate
 from frappe.core.doctype.sms_settings.sms_settings import send_sms
+from pibiconnect.pibiconnect.field_catalog import invalidate_field_catalog
+from pibiconnect.pibiconnect.metadata_cache import get_sensor_var
+from pibiconnect.pibiconnect.notification_outbox import queue_notification
+from pibiconnect.pibiconnect.raw_data_codec import raw_data_rows
+from pibiconnect.pibiconnect.span_table import SpanTable
 import json
 import datetime
 
@@ -212,7 +217,7 @@ def _manage_alert(sensor_var=None, value=None, command=None, reason=None, datada
                     sms_recipients.append(channel['mobile'])
 
         # Get UOM
-        uom = frappe.db.get_value("CN Sensor Var", sensor_var, "uom") or ""
+        uom = get_sensor_var(sensor_var).get('uom') or ""
 
         # Prepare alert log
         alert_log_name = parsed_date.strftime("%y%m%d") + "_" + device_doc.name
@@ -321,28 +326,17 @@ def _manage_alert(sensor_var=None, value=None, command=None, reason=None, datada
             subject = f"RECUPERACIÓN - {device_doc.place}: Alerta finalizada en {device_doc.alias}"
             alert_text = f"{sensor_var} {'high' if command == 'high' else 'low'} finalizada con {value}{uom} a {date_alert}. Compruebalo."
 
-        # Send notifications
+        # Queue notifications
+        summary = f"{alert_text} en {device_doc.alias} ({device_doc.place})"
         if email_recipients:
-            email_text = f"[Email ConectaIoT]: {alert_text} en {device_doc.alias} ({device_doc.place})<br>{html_message}"
-            email_args = {
-                'recipients': email_recipients,
-                'sender': None,
-                'subject': subject,
-                'message': cstr(email_text),
-                'header': [_('Información de Alertas ConectaIoT'), 'blue'],
-                'delayed': False,
-                'retry': 3
-            }
-            frappe.enqueue(method=frappe.sendmail, queue='short', timeout=300, now=True, **email_args)  
+            email_text = f"[Email ConectaIoT]: {summary}<br>{html_message}"
+            for recipient in email_recipients:
+                queue_notification("Email", recipient, subject, cstr(email_text), summary)
             
         if sms_recipients:
-            sms_text = f"[SMS ConectaIoT]: {alert_text} en {device_doc.alias} ({device_doc.place})\n{base_message}"
-            frappe.enqueue(
-                'frappe.core.doctype.sms_settings.sms_settings.send_sms',
-                receiver_list=sms_recipients,
-                msg=sms_text,
-                now=True
-            )
+            sms_text = f"[SMS ConectaIoT]: {summary}\n{base_message}"
+            for recipient in sms_recipients:
+                queue_notification("SMS", recipient, subject, sms_text, summary)
 
         return {
             "message": "Alert processed successfully",
@@ -431,4 +425,45 @@ def update_stability_span(device, sensor_var, stability_span):
     except Exception as e:
         frappe.db.rollback()
         frappe.log_error(frappe.get_traceback(), _("Error updating stability span"))
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+@frappe.whitelist()
+def clear_field_catalog(hostname=None):
+    try:
+        frappe.only_for(["System Manager", "MIoT Administrator"])
+        invalidate_field_catalog(hostname)
+        return {
+            "message": "Field catalog cleared",
+            "hostname": hostname
+        }
+    except frappe.PermissionError:
+        raise
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), _("Error clearing field catalog"))
+        return {"error": str(e)}
+
+
+@frappe.whitelist()
+def get_log_item_raw_data(log_item):
+    """Readings of a CN Log Item as {timestamp, value, raw_value} rows, whatever its encoding"""
+    try:
+        item = frappe.db.get_value("CN Log Item", log_item, ["parent", "raw_data"], as_dict=True)
+        if not item:
+            return {"error": _("Log item {0} not found").format(log_item)}
+
+        frappe.has_permission("CN Device Log", "read", item.parent, throw=True)
+        return raw_data_rows(item.raw_data)
+    except frappe.PermissionError:
+        raise
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), _("Error reading log item raw data"))
+        return {"error": str(e)}
+
+
+@frappe.whitelist()
+def get_device_spans(device):
+    """CN Span curves of a device keyed by lowercase sensor var, as the collector applies them"""
+    frappe.has_permission("CN Span", "read", throw=True)
+    spans = SpanTable()
+    spans.load(device)
+    return spans.curves(device)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import frappe
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Redis hash of hostname -> {'failures', 'open_until', 'reason'}
+BREAKER_KEY = "pibiconnect:influx_breaker"
+
+class HostCircuitBreaker:
+  """Circuit breaker on the InfluxDB queries of each hostname.
+
+  A query that fails, times out or takes longer than `slow_seconds` is a
+  strike against its hostname. After `threshold` strikes in a row the circuit
+  opens and the hostname is skipped for `cooloff_seconds`; the first query
+  after that closes it on success or reopens it on another strike. State lives
+  in a Redis hash so every shard and worker skips the same hostnames.
+  """
+  def __init__(self, threshold: int = 3, cooloff_seconds: int = 900, slow_seconds: Optional[float] = None):
+    self.threshold = max(int(threshold or 0), 1)
+    self.cooloff = cooloff_seconds
+    self.slow_seconds = slow_seconds
+    self._lock = threading.Lock()
+    try:
+      self._entries: Dict[str, Dict] = frappe.cache().hgetall(BREAKER_KEY) or {}
+    except Exception as e:
+      logger.error(f"Error loading InfluxDB circuit breakers: {str(e)}")
+      self._entries = {}
+
+  def is_open(self, hostname: str) -> bool:
+    with self._lock:
+      entry = self._entries.get(hostname)
+    return bool(entry) and entry.get('open_until', 0) > time.time()
+
+  def open_until(self, hostname: str) -> Optional[float]:
+    with self._lock:
+      entry = self._entries.get(hostname)
+    return entry.get('open_until') if entry else None
+
+  def record(self, hostname: str, elapsed: float, error: Optional[Exception] = None) -> None:
+    """Feed the outcome of one query of `hostname` to its breaker"""
+    if error is None and (self.slow_seconds is None or elapsed < self.slow_seconds):
+      with self._lock:
+        entry = self._entries.pop(hostname, None)
+      if entry:
+        self._store(hostname, None)
+      return
+
+    reason = str(error) if error is not None else f"query took {elapsed:.1f}s"
+    with self._lock:
+      entry = dict(self._entries.get(hostname) or {})
+      entry['failures'] = entry.get('failures', 0) + 1
+      entry['reason'] = reason
+      opened = entry['failures'] >= self.threshold
+      if opened:
+        entry['open_until'] = time.time() + self.cooloff
+      self._entries[hostname] = entry
+    self._store(hostname, entry)
+
+    if opened:
+      message = f"InfluxDB queries of {hostname} suspended for {self.cooloff}s after {entry['failures']} failed or slow queries, last: {reason}"
+      logger.warning(message)
+      frappe.log_error(message=message, title="InfluxDB Circuit Open")
+
+  def _store(self, hostname: str, entry: Optional[Dict]) -> None:
+    try:
+      if entry is None:
+        frappe.cache().hdel(BREAKER_KEY, hostname)
+      else:
+        frappe.cache().hset(BREAKER_KEY, hostname, entry)
+    except Exception as e:
+      logger.error(f"Error saving circuit breaker of {hostname}: {str(e)}")
@@ -1,15 +1,38 @@
 import frappe
 from frappe import _
-from influxdb_client import InfluxDBClient
+from influxdb_client import Dialect
 from datetime import datetime, timedelta
 import pytz
 import logging
+import numpy as np
 import json
+import re
+import threading
+import time
+from collections import ChainMap
 from typing import Dict, List, Optional, Any, Tuple
 from frappe.utils import (
   now_datetime, get_datetime, add_to_date, get_datetime_str,
   get_system_timezone, convert_utc_to_system_timezone
 )
+from pibiconnect.pibiconnect.aggregators import (
+  DEFAULT_AGGREGATOR, PUSHDOWN_AGGREGATORS, window_statistics
+)
+from pibiconnect.pibiconnect.alert_rules import AlertRuleTable
+from pibiconnect.pibiconnect.circuit_breaker import HostCircuitBreaker
+from pibiconnect.pibiconnect.collection_queue import CollectionQueue
+from pibiconnect.pibiconnect.cycle_context import load_device_logs, load_device_snapshots
+from pibiconnect.pibiconnect.cycle_writer import CycleWriter
+from pibiconnect.pibiconnect.field_catalog import FieldCatalog
+from pibiconnect.pibiconnect.flux_stream import SeriesArrays, parse_flux_csv
+from pibiconnect.pibiconnect.influx_client import get_influx_client, release_influx_client
+from pibiconnect.pibiconnect.metadata_cache import get_sensor_var, get_sensor_vars
+from pibiconnect.pibiconnect.notification_outbox import queue_notification
+from pibiconnect.pibiconnect.poll_schedule import PollSchedule
+from pibiconnect.pibiconnect.raw_data_codec import encode_raw_data
+from pibiconnect.pibiconnect.series_cursor import SeriesCursorStore, from_epoch_us, to_epoch_us
+from pibiconnect.pibiconnect.shard_lease import LEASE_SECONDS, ShardLease, shard_of
+from pibiconnect.pibiconnect.span_table import SpanTable
 
 # Configure logging
 logging.basicConfig(
@@ -18,6 +41,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Redis hash of shard -> last successful run time when the fleet is sharded
+LAST_RUN_KEY = "pibiconnect:collect_last_run"
+
 class TimezoneHandler:
   """Handle timezone conversions between UTC and system timezone"""
   def __init__(self):
@@ -50,53 +76,33 @@ class TimezoneHandler:
     system_dt = self.utc_to_system(dt) if dt.tzinfo == self.utc else dt
     return system_dt.replace(tzinfo=None)
 
-class InfluxDBConfig:
-  """Class to manage InfluxDB configuration"""
-  def __init__(self):
-    self.settings = frappe.get_single('CN Connect Settings')
-    self.url = self.settings.influxdb_url
-    self.token = self.settings.get_password('influxdb_token')
-    self.bucket = self.settings.influxdb_bucket
-    self.org = self.settings.influxdb_org
-    self.validate()
-
-  def validate(self) -> None:
-    """Validate that all required configuration values are present"""
-    missing = []
-    for attr in ['url', 'token', 'bucket', 'org']:
-      if not getattr(self, attr):
-        missing.append(attr)
-    if missing:
-      raise ValueError(f"Missing InfluxDB configuration in CN Connect Settings: {', '.join(missing)}")
-      
 class InfluxDataFetcher:
+  # Plain CSV without annotations, streamed row by row
+  CSV_DIALECT = Dialect(header=True, annotations=[], date_time_format='RFC3339Nano')
+
   def __init__(self, tz_handler: TimezoneHandler):
-    self.config = InfluxDBConfig()
-    self.client = None
-    self.query_api = None
+    self.config, self.client = get_influx_client()
+    self.query_api = self.client.query_api()
     self.tz = tz_handler
-    self._initialize_client()
+    # End of every fetch window in system time; now when unset
+    self.window_end: Optional[datetime] = None
+    self.breaker = HostCircuitBreaker(
+      self.config.breaker_threshold,
+      self.config.breaker_cooloff,
+      self.config.query_timeout / 2
+    )
 
-  def _initialize_client(self):
-    """Initialize InfluxDB client"""
-    try:
-      self.client = InfluxDBClient(
-        url=self.config.url,
-        token=self.config.token,
-        org=self.config.org
-      )
-      self.query_api = self.client.query_api()
-      logger.info("InfluxDB client initialized successfully")
-    except Exception as e:
-      logger.error(f"Failed to initialize InfluxDB client: {str(e)}")
-      raise
+  def release(self) -> None:
+    """Hand the pooled client back once the cycle is done with it"""
+    release_influx_client(self.client)
 
-  def fetch_latest_readings(self, hostname: str, sensor_var: str, last_run: datetime) -> List[Dict]:
-    """Fetch readings from InfluxDB for a specific field within time window"""
+  def fetch_series(self, hostname: str, sensor_var: str, last_run: datetime) -> SeriesArrays:
+    """Fetch one field of a device within the time window as columnar arrays"""
+    started = time.monotonic()
     try:
       # Convert times to UTC for InfluxDB query
       utc_start = self.tz.format_for_influx(last_run)
-      utc_end = self.tz.format_for_influx(self.tz.get_system_now())
+      utc_end = self.tz.format_for_influx(self.window_end or self.tz.get_system_now())
       
       logger.info(f"Fetching data for {hostname}/{sensor_var} from {utc_start} to {utc_end}")
       
@@ -110,24 +116,193 @@ class InfluxDataFetcher:
           |> sort(columns: ["_time"])
       '''
       
-      result = self.query_api.query(query)
-      readings = []
-      
-      for table in result:
-        for record in table.records:
-          # Convert UTC timestamp to system timezone
-          local_time = self.tz.utc_to_system(record.get_time())
-          readings.append({
-            'timestamp': local_time,
-            'value': record.get_value()
-          })
-      
-      logger.info(f"Fetched {len(readings)} readings for {hostname}/{sensor_var}")
-      return readings
+      series = parse_flux_csv(self.query_api.query_csv(query, dialect=self.CSV_DIALECT)).get((), SeriesArrays())
+      self.breaker.record(hostname, time.monotonic() - started)
+      logger.info(f"Fetched {len(series)} readings for {hostname}/{sensor_var}")
+      return series
 
     except Exception as e:
       logger.error(f"Error fetching data for {hostname} - {sensor_var}: {str(e)}")
-      return []
+      self.breaker.record(hostname, time.monotonic() - started, e)
+      return SeriesArrays()
+
+  def fetch_latest_readings(self, hostname: str, sensor_var: str, last_run: datetime) -> List[Dict]:
+    """Fetch readings from InfluxDB for a specific field within time window"""
+    series = self.fetch_series(hostname, sensor_var, last_run)
+    return [
+      {'timestamp': self.tz.utc_to_system(from_epoch_us(time_us)), 'value': value}
+      for time_us, value in zip(series.times, series.values, strict=True)
+    ]
+
+  def fetch_fleet_readings(self, series: Dict[str, List[str]], start: datetime) -> Dict[Tuple[str, str], SeriesArrays]:
+    """Fetch readings for many hostnames and fields in a few grouped queries.
+
+    `series` maps each hostname to the fields wanted for it. Hostnames are grouped
+    in batches of `fleet_query_batch_size` per query and the streamed result is
+    split back out by (hostname, field) in memory.
+    """
+    readings = {}
+    hostnames = sorted(series)
+    if not hostnames:
+      return readings
+
+    utc_start = self.tz.format_for_influx(start)
+    utc_end = self.tz.format_for_influx(self.window_end or self.tz.get_system_now())
+    batch_size = max(self.config.fleet_batch_size, 1)
+
+    for offset in range(0, len(hostnames), batch_size):
+      batch = hostnames[offset:offset + batch_size]
+      fields = sorted({field for hostname in batch for field in series[hostname]})
+      if not fields:
+        continue
+
+      logger.info(f"Fetching fleet data for {len(batch)} devices from {utc_start} to {utc_end}")
+
+      query = f'''
+        from(bucket: "{self.config.bucket}")
+          |> range(start: {utc_start}, stop: {utc_end})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> filter(fn: (r) => r["hostname"] =~ {self._flux_regex(batch)})
+          |> filter(fn: (r) => r["_field"] =~ {self._flux_regex(fields)})
+          |> keep(columns: ["_time", "_value", "_field", "hostname"])
+          |> sort(columns: ["_time"])
+      '''
+
+      try:
+        rows = self.query_api.query_csv(query, dialect=self.CSV_DIALECT)
+        for (hostname, field), arrays in parse_flux_csv(rows, ('hostname', '_field')).items():
+          key = (hostname, field.lower())
+          if key in readings:
+            readings[key].times.extend(arrays.times)
+            readings[key].values.extend(arrays.values)
+            readings[key].sort()
+          else:
+            readings[key] = arrays
+      except Exception as e:
+        logger.error(f"Error fetching fleet data for batch starting at {batch[0]}: {str(e)}")
+        continue
+
+    logger.info(f"Fetched {sum(len(r) for r in readings.values())} readings for {len(readings)} series")
+    return readings
+
+  def fetch_window_stats(self, series_starts: Dict[Tuple[str, str], datetime]) -> Dict[Tuple[str, str], Dict]:
+    """Compute window statistics inside InfluxDB, one row per series.
+
+    `series_starts` maps (hostname, field) to the UTC start of its window. Only
+    the count, sums, extremes and last timestamp travel over the network; the
+    recency-weighted value is derived from the sums.
+    """
+    stats = {}
+    if not series_starts:
+      return stats
+
+    utc_end = self.tz.format_for_influx(self.window_end or self.tz.get_system_now())
+    hostnames = sorted({host for host, field in series_starts})
+    batch_size = max(self.config.fleet_batch_size, 1)
+
+    for offset in range(0, len(hostnames), batch_size):
+      batch = set(hostnames[offset:offset + batch_size])
+      batch_starts = {key: start for key, start in series_starts.items() if key[0] in batch}
+      range_start = self._flux_time(min(batch_starts.values()))
+      fields = sorted({field for host, field in batch_starts})
+      pairs = ', '.join(
+        f'{{key: "{hostname}|{field}", value: {self._flux_time(start)}}}'
+        for (hostname, field), start in sorted(batch_starts.items())
+      )
+
+      query = f'''
+        import "dict"
+
+        starts = dict.fromList(pairs: [{pairs}])
+
+        from(bucket: "{self.config.bucket}")
+          |> range(start: {range_start}, stop: {utc_end})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> filter(fn: (r) => r["hostname"] =~ {self._flux_regex(sorted(batch))})
+          |> filter(fn: (r) => r["_field"] =~ {self._flux_regex(fields)})
+          |> filter(fn: (r) => r._time >= dict.get(dict: starts, key: r.hostname + "|" + r._field, default: {utc_end}))
+          |> group(columns: ["hostname", "_field"])
+          |> map(fn: (r) => ({{r with
+            _value: float(v: r._value),
+            _t: float(v: uint(v: r._time) - uint(v: {range_start})) / 1000000000.0
+          }}))
+          |> reduce(
+            identity: {{count: 0, sum: 0.0, sum_t: 0.0, sum_vt: 0.0, min: 0.0, max: 0.0,
+                        first_t: 0.0, last_t: 0.0, last_time: time(v: 0)}},
+            fn: (r, accumulator) => ({{
+              count: accumulator.count + 1,
+              sum: accumulator.sum + r._value,
+              sum_t: accumulator.sum_t + r._t,
+              sum_vt: accumulator.sum_vt + r._value * r._t,
+              min: if accumulator.count == 0 or r._value < accumulator.min then r._value else accumulator.min,
+              max: if accumulator.count == 0 or r._value > accumulator.max then r._value else accumulator.max,
+              first_t: if accumulator.count == 0 or r._t < accumulator.first_t then r._t else accumulator.first_t,
+              last_t: if accumulator.count == 0 or r._t >= accumulator.last_t then r._t else accumulator.last_t,
+              last_time: if accumulator.count == 0 or r._t >= accumulator.last_t then r._time else accumulator.last_time
+            }})
+          )
+      '''
+
+      # Only a single-device query can be blamed on its hostname
+      blamed = next(iter(batch)) if len(batch) == 1 else None
+      started = time.monotonic()
+      try:
+        result = self.query_api.query(query)
+      except Exception as e:
+        logger.error(f"Error fetching window statistics for batch of {len(batch)} devices: {str(e)}")
+        if blamed:
+          self.breaker.record(blamed, time.monotonic() - started, e)
+        continue
+      if blamed:
+        self.breaker.record(blamed, time.monotonic() - started)
+
+      for table in result:
+        for record in table.records:
+          values = record.values
+          stats[(values.get('hostname'), values.get('_field').lower())] = {
+            key: values.get(key)
+            for key in ('count', 'sum', 'sum_t', 'sum_vt', 'min', 'max', 'first_t', 'last_t', 'last_time')
+          }
+
+    logger.info(f"Fetched window statistics for {len(stats)} series")
+    return stats
+
+  @staticmethod
+  def _flux_time(dt: datetime) -> str:
+    """RFC3339 literal with microseconds for an aware datetime"""
+    return dt.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+  @staticmethod
+  def _flux_regex(values: List[str]) -> str:
+    """Build an anchored Flux regex literal matching any of the given values"""
+    alternatives = '|'.join(re.escape(value).replace('/', '\\/') for value in values)
+    return f'/^({alternatives})$/'
+
+  def discover_fields(self, hostnames: List[str]) -> Optional[Dict[str, List[str]]]:
+    """Fields reported in the last hour by each hostname, in grouped queries"""
+    fields = {}
+    batch_size = max(self.config.fleet_batch_size, 1)
+    try:
+      for offset in range(0, len(hostnames), batch_size):
+        batch = sorted(hostnames[offset:offset + batch_size])
+        query = f'''
+          from(bucket: "{self.config.bucket}")
+            |> range(start: -1h)
+            |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+            |> filter(fn: (r) => r["hostname"] =~ {self._flux_regex(batch)})
+            |> keep(columns: ["hostname", "_field"])
+            |> group(columns: ["hostname"])
+            |> distinct(column: "_field")
+        '''
+        for table in self.query_api.query(query):
+          for record in table.records:
+            fields.setdefault(record.values.get('hostname'), []).append(record.get_value())
+
+      logger.info(f"Discovered fields for {len(fields)} of {len(hostnames)} devices")
+      return fields
+    except Exception as e:
+      logger.error(f"Error discovering fields: {str(e)}")
+      return None
 
   def get_available_fields(self, hostname: str) -> List[str]:
     """Get available fields for a device"""
@@ -154,9 +329,11 @@ class InfluxDataFetcher:
       return []
 
 class AlertHandler:
-    def __init__(self, device_doc, current_time):
+    def __init__(self, device_doc, current_time, notify=True):
         """Initialize AlertHandler with device document and current time"""
         self.device_doc = device_doc
+        # Stale alerts found while catching up are logged without notifications
+        self.notify = notify
         # Ensure current_time is timezone-aware
         if current_time.tzinfo is None:
             self.current_time = pytz.timezone(get_system_timezone()).localize(current_time)
@@ -210,6 +387,9 @@ class AlertHandler:
 
     def _get_warning_channels(self):
         """Get active warning channels for the device"""
+        # Device snapshots of a collection cycle carry their channels
+        if self.device_doc.get('warning_channels') is not None:
+            return self.device_doc.warning_channels
         try:
             channels = frappe.db.sql("""
                 SELECT channel_type, email, mobile 
@@ -223,6 +403,8 @@ class AlertHandler:
             return []
 
     def manage_alert(self, sensor_var, current_value, alert_type, reason, threshold):
+      if not self.notify:
+        return True
       try:
         current_time_naive = self._strip_timezone(self.current_time)
         channels = self._get_warning_channels()
@@ -244,7 +426,7 @@ class AlertHandler:
                 if channel['mobile'] not in sms_recipients:
                     sms_recipients.append(channel['mobile'])
 
-        uom = frappe.db.get_value("CN Sensor Var", sensor_var, "uom") or ""
+        uom = get_sensor_var(sensor_var).get('uom') or ""
         date_alert = current_time_naive.strftime("%d/%m/%y %H:%M")
 
         if reason == 'start':
@@ -271,12 +453,9 @@ class AlertHandler:
             </div>
             """
             
-            frappe.sendmail(
-                recipients=email_recipients,
-                subject=subject,
-                message=html_message,
-                header=['Información de Alertas ConectaIoT', 'blue']
-            )
+            summary = f"{alert_text} en {self.device_doc.alias} ({self.device_doc.place})"
+            for recipient in email_recipients:
+                queue_notification("Email", recipient, subject, html_message, summary)
 
             if sms_recipients:
                 sms_text = f"""[SMS ConectaIoT]: {alert_text}
@@ -287,11 +466,7 @@ Sistema de Monitoreo de Alarmas Automaticas de ConectaIoT
 Para desactivar alertas, contacte al Administrador"""
 
                 for recipient in sms_recipients:
-                    frappe.sendmail(
-                        recipients=[recipient],
-                        subject='SMS Alert',
-                        message=sms_text
-                    )
+                    queue_notification("SMS Email", recipient, subject, sms_text, summary)
 
             return True
 
@@ -299,58 +474,8 @@ Para desactivar alertas, contacte al Administrador"""
             logger.error(f"Error in manage_alert: {str(e)}")
             return False
 
-    def process_value(self, sensor_var, current_value):
-      """Process a single sensor value and manage its alerts"""
-      try:
-        frappe.db.begin()
-        
-        alert_items = frappe.get_all(
-            "CN Alert Item",
-            filters={
-                "parent": self.device_doc.name,
-                "sensor_var": sensor_var,
-                "warning_disabled": 0
-            },
-            fields=["name", "high_value", "low_value", "alert_high", "alert_low",
-                   "active_high", "active_low", "alert_cooldown", "last_alert_time"]
-        )
-        
-        if not alert_items:
-            frappe.db.commit()
-            return
-            
-        alert_item = frappe.get_doc("CN Alert Item", alert_items[0].name)
-        changes = []
-        
-        # Direct comparison with thresholds since value is already transformed
-        if alert_item.alert_high and alert_item.high_value is not None:
-            high_value = float(alert_item.high_value)
-            if float(current_value) >= high_value and not alert_item.active_high:
-                changes.append(("high", "start", high_value))
-            elif float(current_value) < high_value and alert_item.active_high:
-                changes.append(("high", "finish", high_value))
-
-        if alert_item.alert_low and alert_item.low_value is not None:
-            low_value = float(alert_item.low_value)
-            if float(current_value) <= low_value and not alert_item.active_low:
-                changes.append(("low", "start", low_value))
-            elif float(current_value) > low_value and alert_item.active_low:
-                changes.append(("low", "finish", low_value))
-
-        if not changes:
-            frappe.db.commit()
-            return
-
-        # Check cooldown
-        if alert_item.last_alert_time:
-            last_alert = self._localize_datetime(alert_item.last_alert_time)
-            cooldown = int(alert_item.alert_cooldown or 0)
-            time_since_last = (self.current_time - last_alert).total_seconds()
-            
-            if time_since_last < cooldown:
-                frappe.db.commit()
-                return
-
+    def apply_changes(self, alert_item, sensor_var, current_value, changes):
+        """Record alert state changes of an alert item and notify its warning channels"""
         alert_log = self._get_alert_log()
         if not alert_log:
             frappe.db.rollback()
@@ -409,204 +534,376 @@ Para desactivar alertas, contacte al Administrador"""
                 logger.error(f"Error processing alert change: {str(e)}")
                 continue
 
-      except Exception as e:
-        frappe.db.rollback()
-        logger.error(f"Error processing alerts for {sensor_var}: {str(e)}")
-        raise
-
 class DeviceManager:
+  # Fleet queries never reach further back than this before the last run;
+  # series further behind are fetched on their own from their cursor
+  FLEET_MAX_LOOKBACK_HOURS = 1
+
   def __init__(self, influx_fetcher: InfluxDataFetcher, tz_handler: TimezoneHandler):
     self.influx = influx_fetcher
     self.tz = tz_handler
-
-  def calculate_representative_value(self, values: List[float], timestamps: List[datetime]) -> float:
-    """Calculate weighted average giving more weight to recent values"""
-    if not values:
-      return 0
-      
-    if len(values) == 1:
-      return values[0]
-      
-    # Convert timestamps to seconds from earliest reading
-    start_time = min(timestamps)
-    time_diffs = [(t - start_time).total_seconds() for t in timestamps]
-    
-    # Calculate weights - more recent values get higher weights
-    max_diff = max(time_diffs)
-    if max_diff == 0:  # All readings at same time
-      weights = [1/len(values)] * len(values)
+    self.writer = CycleWriter(influx_fetcher.config.write_batch_size)
+    self.cursors = SeriesCursorStore(tz_handler, influx_fetcher.config.lateness_window, self.writer)
+    self.fields = FieldCatalog(influx_fetcher, influx_fetcher.config.field_catalog_ttl)
+    self.pushdown = influx_fetcher.config.aggregation_pushdown
+    self.spans = SpanTable()
+    self.alerts = AlertRuleTable(tz_handler)
+    self.adaptive_polling = influx_fetcher.config.adaptive_polling
+    self.polls = PollSchedule()
+    self.sensor_vars: Dict[str, Dict] = {}
+    self.log_date = None
+    self.device_logs: Dict[str, List] = {}
+
+  def prepare_cycle(self) -> None:
+    """Load the state shared by every device of a collection cycle"""
+    self.cursors.load()
+    self.spans.load()
+    self.alerts.load()
+    if self.adaptive_polling:
+      self.polls.load()
+    self.sensor_vars = get_sensor_vars()
+    self.log_date = now_datetime().date()
+    self.device_logs = load_device_logs(self.log_date)
+
+  def get_series_start(self, device_name: str, data_item, last_run: datetime) -> datetime:
+    """Start of the fetch window for a single data item, resuming from its cursor"""
+    cursor = self.cursors.get(device_name, data_item)
+    start = cursor.start_time(self.cursors.lateness_us)
+    return self.tz.format_for_frappe(start) if start else last_run
+
+  def get_pushdown_series(self, device_doc: 'frappe.model.document.Document') -> set:
+    """Sensor vars of a device whose window statistics are computed inside InfluxDB.
+
+    Raw points are still downloaded when the device keeps raw data, when a
+    CN Span has to be applied to every reading or when the sensor var uses an
+    aggregator that cannot be derived from running sums.
+    """
+    if not self.pushdown or device_doc.store_raw_data:
+      return set()
+    return {
+      item.sensor_var.lower() for item in device_doc.data_item
+      if self.sensor_vars.get(item.sensor_var.lower(), {}).get('aggregator', DEFAULT_AGGREGATOR) in PUSHDOWN_AGGREGATORS
+    } - self.spans.sensor_vars(device_doc.name)
+
+  def get_stats_starts(self, device_doc: 'frappe.model.document.Document', series: set,
+                       last_run: datetime) -> Dict[Tuple[str, str], datetime]:
+    """UTC window start of each pushdown series, strictly after its watermark.
+
+    Window statistics cannot tell late points apart, so the lateness window
+    does not apply to pushdown series.
+    """
+    starts = {}
+    for data_item in device_doc.data_item:
+      sensor_var = data_item.sensor_var.lower()
+      if sensor_var not in series:
+        continue
+      cursor = self.cursors.get(device_doc.name, data_item)
+      if cursor.watermark is not None:
+        starts[(device_doc.hostname, sensor_var)] = from_epoch_us(cursor.watermark + 1)
+      else:
+        starts[(device_doc.hostname, sensor_var)] = self.tz.system_to_utc(last_run)
+    return starts
+
+  def prefetch_fleet_readings(self, device_docs: List['frappe.model.document.Document'],
+                              last_run: datetime) -> Dict[str, Dict]:
+    """Fetch the cycle window for every device and data item in grouped queries.
+
+    Returns raw readings under 'readings' and pushdown statistics under 'stats',
+    both keyed by (hostname, field), and under 'behind' the series that start
+    before the fleet window and are left to their own queries.
+    """
+    series = {}
+    starts = []
+    stats_starts = {}
+    behind = set()
+    earliest = add_to_date(last_run, hours=-self.FLEET_MAX_LOOKBACK_HOURS)
+    earliest_utc = self.tz.system_to_utc(earliest)
+
+    for device_doc in device_docs:
+      if not device_doc.hostname or not device_doc.data_item:
+        continue
+      if self.influx.breaker.is_open(device_doc.hostname):
+        continue
+      pushdown = self.get_pushdown_series(device_doc)
+      for key, start in self.get_stats_starts(device_doc, pushdown, last_run).items():
+        if start < earliest_utc:
+          behind.add(key)
+        else:
+          stats_starts[key] = start
+      for data_item in device_doc.data_item:
+        sensor_var = data_item.sensor_var.lower()
+        if sensor_var in pushdown:
+          continue
+        start = self.get_series_start(device_doc.name, data_item, last_run)
+        if start < earliest:
+          behind.add((device_doc.hostname, sensor_var))
+          continue
+        series.setdefault(device_doc.hostname, set()).add(sensor_var)
+        starts.append(start)
+
+    readings = {}
+    if series:
+      readings = self.influx.fetch_fleet_readings({h: sorted(f) for h, f in series.items()}, min(starts))
+    stats = self.influx.fetch_window_stats(stats_starts) if stats_starts else {}
+    if behind:
+      logger.info(f"{len(behind)} series are behind the fleet window and are fetched on their own")
+    return {'readings': readings, 'stats': stats, 'behind': behind}
+
+  def transform_with_span(self, device: str, sensor_var: str, voltage_values: np.ndarray) -> np.ndarray:
+    """Transform voltage values using the CN Span of the series if available"""
+    span = self.spans.get(device, sensor_var)
+    if span is None:
+      return np.asarray(voltage_values, dtype=np.float64)
+    return span.apply(voltage_values)
+
+  def representative_from_moments(self, count: int, sum_v: float, sum_t: float, sum_vt: float,
+                                  first_t: float, last_t: float) -> float:
+    """Recency-weighted mean from running sums, as aggregators.recency_weighted"""
+    if count == 1 or last_t == first_t:
+      return sum_v / count
+    return (sum_vt - first_t * sum_v) / (sum_t - count * first_t)
+
+  def window_from_readings(self, device_name: str, data_item, readings: SeriesArrays,
+                           store_raw_data: bool) -> Optional[Dict]:
+    """Window statistics of a series from its raw readings, with its raw data when the device keeps it"""
+    if not len(readings):
+      return None
+
+    has_span = self.spans.get(device_name, data_item.sensor_var) is not None
+
+    times = np.frombuffer(readings.times, dtype=np.int64)
+    raw_values = np.frombuffer(readings.values, dtype=np.float64)
+    # Non-numeric values arrive as NaN
+    valid = ~np.isnan(raw_values)
+    times = times[valid]
+    raw_values = raw_values[valid]
+    values = self.transform_with_span(device_name, data_item.sensor_var, raw_values) if has_span else raw_values
+
+    window = {
+      'count': len(readings),
+      'readings': int(values.size),
+      'timestamps': readings.times
+    }
+    if values.size:
+      sensor_var = self.sensor_vars.get(data_item.sensor_var.lower(), {})
+      window.update(window_statistics(times, values, sensor_var.get('aggregator'), sensor_var.get('aggregator_param')))
+      window['latest_time'] = from_epoch_us(int(times[-1]))
+      window['series'] = (times, values)
+      window['raw_data'] = encode_raw_data(times, values, raw_values if has_span else None) if store_raw_data else None
+    return window
+
+  def window_from_stats(self, stats: Optional[Dict], aggregator: Optional[str] = None) -> Optional[Dict]:
+    """Window statistics of a series from its pushdown row"""
+    if not stats or not stats['count']:
+      return None
+
+    count = stats['count']
+    average = stats['sum'] / count
+    if (aggregator or DEFAULT_AGGREGATOR) == 'Mean':
+      value = average
     else:
-      weights = [diff/max_diff for diff in time_diffs]
-      # Normalize weights
-      weight_sum = sum(weights)
-      weights = [w/weight_sum for w in weights]
-    
-    # Calculate weighted average
-    weighted_sum = sum(value * weight for value, weight in zip(values, weights))
-    
-    return weighted_sum
-  
-  def transform_with_span(self, device: str, sensor_var: str, voltage_value: float) -> float:
-    """Transform voltage value using CN Span if available"""
-    try:
-        filters = [['device', '=', device], ['sensor_var', '=', sensor_var]]
-        span_name = frappe.db.get_value('CN Span', filters, 'name')
-        
-        if span_name:
-            span_doc = frappe.get_doc('CN Span', span_name)
-            # Only transform if spans are defined
-            if span_doc.higher_span and span_doc.lower_span:
-                calibration_factor = 0.00
-                # Ensure voltage is at least calibration_factor to avoid negative values
-                adjusted_voltage = max(voltage_value - calibration_factor, 0)
-                return span_doc.lower_span + (adjusted_voltage * span_doc.span_factor)
-            
-        return voltage_value
-    except Exception as e:
-        logger.error(f"Error in span transformation: {str(e)}")
-        return voltage_value
+      value = self.representative_from_moments(
+        count, stats['sum'], stats['sum_t'], stats['sum_vt'], stats['first_t'], stats['last_t']
+      )
+    return {
+      'count': count,
+      'readings': count,
+      'timestamps': [to_epoch_us(stats['last_time'])],
+      'value': value,
+      'average': average,
+      'maximum': stats['max'],
+      'minimum': stats['min'],
+      'latest_time': self.tz.utc_to_system(stats['last_time']),
+      'series': (np.array([to_epoch_us(stats['last_time'])], dtype=np.int64), np.array([value], dtype=np.float64)),
+      'raw_data': None
+    }
+
+  def _get_readings(self, hostname: str, data_item, cursor, last_run: datetime,
+                    prefetched: Optional[Dict[str, Dict]]) -> SeriesArrays:
+    """Readings of a series not ingested yet, from the fleet prefetch or a dedicated query"""
+    sensor_var = data_item.sensor_var.lower()
+    start_time = self.get_series_start(cursor.device, data_item, last_run)
+    if prefetched is None or (hostname, sensor_var) in prefetched['behind']:
+      readings = self.influx.fetch_series(
+        hostname,
+        sensor_var,
+        start_time
+      )
+    else:
+      utc_start = to_epoch_us(self.tz.system_to_utc(start_time))
+      readings = prefetched['readings'].get((hostname, sensor_var), SeriesArrays()).since(utc_start)
+    return self.cursors.filter_new(cursor, readings)
+
+  def _get_device_log(self, device_name: str) -> Tuple[str, int]:
+    """Name of today's CN Device Log of a device and the last idx of its log items"""
+    current_date = now_datetime().date()
+    if current_date == self.log_date and device_name in self.device_logs:
+      return tuple(self.device_logs[device_name])
+    log_filters = {
+      'device': device_name,
+      'date': current_date
+    }
+
+    log_name = frappe.db.exists('CN Device Log', log_filters)
+    if log_name:
+      last_idx = frappe.db.sql("""
+        SELECT MAX(idx) FROM `tabCN Log Item`
+        WHERE parent = %s AND parenttype = 'CN Device Log' AND parentfield = 'log_item'
+      """, log_name)[0][0]
+      return log_name, last_idx or 0
+
+    log_doc = frappe.get_doc({
+      'doctype': 'CN Device Log',
+      'device': device_name,
+      'date': current_date,
+      'log_item': []
+    })
+    log_doc.insert(ignore_permissions=True)
+    frappe.db.commit()
+    return log_doc.name, 0
+
+  def update_device_data(self, device_doc: 'frappe.model.document.Document', last_run: datetime,
+                         prefetched: Optional[Dict[str, Dict]] = None) -> None:
+    """Process the new readings of a device.
 
-  def update_device_data(self, device_doc: 'frappe.model.document.Document', last_run: datetime) -> None:
+    When `prefetched` holds the result of a fleet query, readings and window
+    statistics are taken from it instead of querying InfluxDB per device.
+    """
     try:
       if not device_doc.hostname or not device_doc.data_item:
         return
 
       device_name = device_doc.name
       hostname = device_doc.hostname
+      if self.influx.breaker.is_open(hostname):
+        reopen = datetime.fromtimestamp(self.influx.breaker.open_until(hostname))
+        logger.warning(f"Skipping device {device_name}: InfluxDB queries of {hostname} suspended until {reopen}")
+        return
       window_readings = 0
+      busiest_series = 0
       
-      available_fields = [field.lower() for field in self.influx.get_available_fields(hostname)]
-      if not available_fields:
-        return
-
-      current_date = now_datetime().date()
-      log_filters = {
-        'device': device_name,
-        'date': current_date
-      }
-
-      log_name = frappe.db.exists('CN Device Log', log_filters)
-      if log_name:
-        log_doc = frappe.get_doc('CN Device Log', log_name)
+      if prefetched is None:
+        available_fields = self.fields.get(hostname)
+        if not available_fields:
+          return
       else:
-        log_doc = frappe.get_doc({
-          'doctype': 'CN Device Log',
-          'device': device_name,
-          'date': current_date,
-          'log_item': []
-        })
-        log_doc.insert(ignore_permissions=True)
-        frappe.db.commit()
+        available_fields = [item.sensor_var.lower() for item in device_doc.data_item]
+
+      pushdown = self.get_pushdown_series(device_doc)
+      if prefetched is not None:
+        stats = prefetched['stats']
+        behind = {sensor_var for sensor_var in pushdown if (hostname, sensor_var) in prefetched['behind']}
+        if behind:
+          stats = ChainMap(self.influx.fetch_window_stats(self.get_stats_starts(device_doc, behind, last_run)), stats)
+      elif pushdown:
+        stats = self.influx.fetch_window_stats(
+          self.get_stats_starts(device_doc, pushdown.intersection(available_fields), last_run)
+        )
+      else:
+        stats = {}
+
+      log_name, log_idx = self._get_device_log(device_name)
 
       for data_item in device_doc.get('data_item', []):
         sensor_var = data_item.sensor_var.lower()
         
         if sensor_var not in available_fields:
           continue
-        
-        has_span = frappe.db.exists("CN Span", {
-          "device": device_name,
-          "sensor_var": data_item.sensor_var
-        })
 
-        start_time = get_datetime(data_item.last_recorded) if data_item.last_recorded else last_run
-        readings = self.influx.fetch_latest_readings(
-          hostname,
-          sensor_var,
-          start_time
-        )
+        cursor = self.cursors.get(device_name, data_item)
+        if sensor_var in pushdown:
+          aggregator = self.sensor_vars.get(sensor_var, {}).get('aggregator')
+          window = self.window_from_stats(stats.get((hostname, sensor_var)), aggregator)
+        else:
+          readings = self._get_readings(hostname, data_item, cursor, last_run, prefetched)
+          window = self.window_from_readings(device_name, data_item, readings, device_doc.store_raw_data)
 
-        if readings:
-          window_readings += len(readings)
-          try:
-            values = []
-            timestamps = []
-            raw_data = []
-            latest_time = None
-
-            for reading in readings:
-              try:
-                raw_value = float(reading['value'])
-                value = self.transform_with_span(device_name, data_item.sensor_var, raw_value) if has_span else raw_value
-                
-                values.append(value)
-                timestamps.append(reading['timestamp'])
-                latest_time = reading['timestamp']
-                
-                raw_data.append({
-                  'timestamp': self.tz.format_for_frappe(reading['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
-                  'value': str(value),
-                  'raw_value': str(raw_value) if has_span else None
-                })
-              except (ValueError, TypeError):
-                continue
+        if not window:
+          continue
 
-            if values and latest_time:
-              reading_count = len(values)
-              representative_value = self.calculate_representative_value(values, timestamps)
-              window_avg = sum(values) / reading_count
-              window_max = max(values)
-              window_min = min(values)
-              latest_time_system = self.tz.format_for_frappe(latest_time)
-
-              frappe.db.set_value('CN Data Item', data_item.name, {
-                'value': str(round(float(representative_value), 2)),
-                'last_recorded': latest_time_system,
-                'reading': (data_item.reading or 0) + reading_count,
-                'average': window_avg,
-                'maximum': window_max,
-                'minimum': window_min
-              }, update_modified=False)
-
-              frappe.db.set_value('CN Device', device_name, {
-                'connected': 1,
-                'connected_at': latest_time_system
-              }, update_modified=False)
-
-              existing_idx = None
-              for idx, log_item in enumerate(log_doc.log_item):
-                if log_item.sensor_var.lower() == sensor_var:
-                  existing_idx = idx
-                  break
-
-              new_log_item = {
-                'sensor_var': sensor_var,
-                'uom': data_item.uom,
-                'value': str(round(float(representative_value), 2)),
-                'data_date': latest_time_system,
-                'chart_type': self._get_chart_type(sensor_var),
-                'raw_data': json.dumps(raw_data)
-              }
-
-              if existing_idx is not None:
-                log_doc.append('log_item', new_log_item)
-              else:
-                log_doc.append('log_item', new_log_item)
-              
-              log_doc.save(ignore_permissions=True)
-              frappe.db.commit()
-              
-              current_time = self.tz.get_system_now()
-              alert_handler = AlertHandler(device_doc=device_doc, current_time=current_time)
-              alert_handler.process_value(sensor_var, representative_value)
-
-          except Exception as e:
-            logger.error(f"Error processing readings: {str(e)}")
-            frappe.db.rollback()
+        window_readings += window['count']
+        busiest_series = max(busiest_series, window['count'])
+        try:
+          if window['readings']:
+            representative_value = window['value']
+            latest_time_system = self.tz.format_for_frappe(window['latest_time'])
+            data_item.reading = (data_item.reading or 0) + window['readings']
+
+            self.writer.update('CN Data Item', data_item.name, {
+              'value': str(round(float(representative_value), 2)),
+              'last_recorded': latest_time_system,
+              'reading': data_item.reading,
+              'average': window['average'],
+              'maximum': window['maximum'],
+              'minimum': window['minimum']
+            })
+
+            self.writer.update('CN Device', device_name, {
+              'connected': 1,
+              'connected_at': latest_time_system
+            })
+
+            log_idx += 1
+            self.writer.insert_child('CN Log Item', 'CN Device Log', log_name, 'log_item', log_idx, {
+              'sensor_var': sensor_var,
+              'uom': data_item.uom,
+              'value': str(round(float(representative_value), 2)),
+              'data_date': latest_time_system,
+              'chart_type': self._get_chart_type(sensor_var),
+              'raw_data': window['raw_data']
+            })
+            self.writer.update('CN Device Log', log_name, {'modified': now_datetime()})
+
+          # Points without a usable value are skipped for good as well
+          self.cursors.advance(cursor, window['timestamps'])
+
+          if window['readings']:
+            self.alerts.record(device_doc, sensor_var, *window['series'])
+
+        except Exception as e:
+          logger.error(f"Error processing readings: {str(e)}")
+          frappe.db.rollback()
 
       if window_readings == 0 and device_doc.connected:
-        frappe.db.set_value('CN Device', device_name, {
+        self.writer.update('CN Device', device_name, {
           'connected': 0,
           'connected_at': None
-        }, update_modified=False)
-        frappe.db.commit()
+        })
+
+      if self.adaptive_polling:
+        self.polls.observe(device_name, busiest_series, self.alerts.has_active(device_name))
 
     except Exception as e:
       frappe.log_error(message=str(e), title=f"Device Update Error - {device_doc.name}")
       frappe.db.rollback()
+      self.writer.discard()
+
+  def process_alerts(self, stale_before: Optional[datetime] = None) -> None:
+    """Apply the alert events found in the points recorded this cycle.
+
+    Each event is logged and notified at the time of its crossing point. Events
+    before `stale_before` are logged without notifying anyone.
+    """
+    alert_items = {}
+    for event in self.alerts.evaluate():
+      try:
+        alert_item = alert_items.get(event['alert_item'])
+        if alert_item is None:
+          alert_item = alert_items[event['alert_item']] = frappe.get_doc('CN Alert Item', event['alert_item'])
+        event_time = self.tz.utc_to_system(from_epoch_us(event['time_us']))
+        notify = stale_before is None or self.tz.format_for_frappe(event_time) >= stale_before
+        alert_handler = AlertHandler(device_doc=event['device_doc'], current_time=event_time, notify=notify)
+        alert_handler.apply_changes(alert_item, event['sensor_var'], event['value'], event['changes'])
+      except Exception as e:
+        logger.error(f"Error processing alerts for {event['sensor_var']}: {str(e)}")
+        frappe.db.rollback()
 
   def _get_chart_type(self, sensor_var: str) -> str:
     sensor_var_lower = sensor_var.lower()
+    chart_type = self.sensor_vars.get(sensor_var_lower, {}).get('chart_type')
+    if chart_type and chart_type != "None":
+      return chart_type.lower()
+    # Defaults for sensor vars without a chart type
     if sensor_var_lower in ["temperature", "humidity", "pressure"]:
       return "area"
     elif sensor_var_lower in ["battery", "voltage"]:
@@ -615,8 +912,16 @@ class DeviceManager:
       return "scatter"
     return "line"  # Default chart type
 
-def get_last_run_time() -> datetime:
-  """Get the last successful run time from CN Connect Settings"""
+def get_last_run_time(shard: int = 0, shard_count: int = 1) -> datetime:
+  """Get the last successful run time of a shard, or from CN Connect Settings"""
+  if shard_count > 1:
+    try:
+      last_run = frappe.cache().hget(LAST_RUN_KEY, str(shard))
+      if last_run:
+        return get_datetime(last_run)
+    except Exception as e:
+      logger.error(f"Error getting last run time of shard {shard}: {str(e)}")
+
   try:
     settings = frappe.get_single('CN Connect Settings')
     last_run = settings.last_data_collection
@@ -628,53 +933,236 @@ def get_last_run_time() -> datetime:
   # If no last run time, default to 1 hour ago
   return add_to_date(now_datetime(), hours=-1)
 
-def update_last_run_time(run_time: datetime) -> None:
-  """Update the last successful run time in CN Connect Settings"""
+def update_last_run_time(run_time: datetime, shard: int = 0, shard_count: int = 1) -> None:
+  """Update the last successful run time of a shard and in CN Connect Settings.
+
+  With several shards, CN Connect Settings shows the oldest of them.
+  """
   try:
-    settings = frappe.get_single('CN Connect Settings')
-    settings.last_data_collection = run_time
-    settings.save(ignore_permissions=True)
+    if shard_count > 1:
+      frappe.cache().hset(LAST_RUN_KEY, str(shard), str(run_time))
+      shard_runs = frappe.cache().hgetall(LAST_RUN_KEY) or {}
+      runs = [get_datetime(shard_runs[str(i)]) for i in range(shard_count) if shard_runs.get(str(i))]
+      run_time = min(runs) if len(runs) == shard_count else None
+      if run_time is None:
+        return
+      frappe.db.set_single_value('CN Connect Settings', 'last_data_collection', run_time)
+      frappe.db.commit()
+      return
+
+    # Written directly so the routine update does not rebuild the InfluxDB clients
+    frappe.db.set_single_value('CN Connect Settings', 'last_data_collection', run_time)
     frappe.db.commit()
   except Exception as e:
     logger.error(f"Error updating last run time: {str(e)}")
     frappe.db.rollback()
 
+def process_device(device_manager: DeviceManager, device_doc: 'frappe.model.document.Document',
+                   last_run: datetime, prefetched: Optional[Dict] = None) -> None:
+  """Process a single device and hand its writes to the cycle writer as one unit"""
+  try:
+    logger.info(f"Processing device {device_doc.name}")
+    with device_manager.writer.unit():
+      device_manager.update_device_data(device_doc, last_run, prefetched)
+    device_manager.writer.flush_if_full()
+  except Exception as e:
+    logger.error(f"Error processing device {device_doc.name}: {str(e)}")
+    frappe.db.rollback()
+
+def _device_worker(site: str, sites_path: str, work: CollectionQueue, device_manager: DeviceManager,
+                   last_run: datetime, prefetched: Optional[Dict], lease: Optional[ShardLease] = None) -> None:
+  """Drain the work queue with a site connection owned by this thread"""
+  frappe.init(site=site, sites_path=sites_path)
+  frappe.connect()
+  try:
+    while not (lease and lease.lost):
+      device_doc = work.pop()
+      if device_doc is None:
+        break
+      process_device(device_manager, device_doc, last_run, prefetched)
+  finally:
+    frappe.destroy()
+
+def process_devices(device_manager: DeviceManager, work: CollectionQueue, last_run: datetime,
+                    prefetched: Optional[Dict] = None, workers: int = 1,
+                    lease: Optional[ShardLease] = None) -> None:
+  """Process queued devices sequentially or with a bounded pool of worker threads.
+
+  Each worker opens its own database connection. The writes of a device, its
+  data and its cursors, join the shared CycleWriter batch together once the
+  device is done, and whichever thread fills the batch commits it, so a commit
+  may span several devices but never part of one. Processing stops when the
+  queue's budget is spent or if the shard lease is lost.
+  """
+  workers = min(workers, len(work))
+  if workers <= 1:
+    while not (lease and lease.lost):
+      device_doc = work.pop()
+      if device_doc is None:
+        break
+      process_device(device_manager, device_doc, last_run, prefetched)
+    return
+
+  threads = [
+    threading.Thread(
+      target=_device_worker,
+      args=(frappe.local.site, frappe.local.sites_path, work, device_manager, last_run, prefetched, lease),
+      name=f"pibiconnect-collector-{i}",
+      daemon=True
+    )
+    for i in range(workers)
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
 def collect_influx_data() -> None:
-  """Main function to collect and process InfluxDB data"""
+  """Scheduler tick: collect every shard of the fleet.
+
+  With a single shard the collection runs in this job; otherwise one
+  background job per shard is enqueued and each runs under the shard's lease.
+  A shard whose previous job still holds the lease is left to it.
+  """
+  shard_count = max(int(frappe.db.get_single_value('CN Connect Settings', 'collection_shards') or 1), 1)
+  if shard_count == 1:
+    collect_shard(0, 1)
+    return
+
+  for shard in range(shard_count):
+    frappe.enqueue(
+      'pibiconnect.pibiconnect.collect_influx_data.collect_shard',
+      queue='long',
+      timeout=LEASE_SECONDS * 4,
+      job_name=f"pibiconnect-collect-{shard}",
+      shard=shard,
+      shard_count=shard_count
+    )
+
+def collect_shard(shard: int = 0, shard_count: int = 1) -> None:
+  """Collect the devices of one shard while holding its lease"""
+  lease = ShardLease(shard)
+  if not lease.acquire():
+    logger.info(f"Shard {shard} is still being collected, skipping this tick")
+    return
+  try:
+    run_collection(shard, shard_count, lease)
+  finally:
+    lease.release()
+
+def collect_window(device_manager: DeviceManager, work: CollectionQueue, last_run: datetime,
+                   lease: Optional[ShardLease] = None) -> None:
+  """Fetch and process the queued devices from `last_run` and flush their writes"""
+  device_docs = work.devices()
+  config = device_manager.influx.config
+  prefetched = None
+  if config.fetch_mode == 'Fleet':
+    prefetched = device_manager.prefetch_fleet_readings(device_docs, last_run)
+  else:
+    wanted = {}
+    for device_doc in device_docs:
+      if device_doc.hostname and device_doc.data_item:
+        wanted.setdefault(device_doc.hostname, set()).update(
+          item.sensor_var.lower() for item in device_doc.data_item
+        )
+    device_manager.fields.prime(wanted)
+
+  process_devices(device_manager, work, last_run, prefetched, config.workers, lease)
+  device_manager.writer.flush()
+
+def backfill(influx_fetcher: InfluxDataFetcher, last_run: datetime, current_run: datetime,
+             shard: int = 0, shard_count: int = 1, lease: Optional[ShardLease] = None) -> datetime:
+  """Catch up on a long collection gap in fixed time chunks.
+
+  Chunks are processed oldest first, each one with the usual worker pool and
+  a fetch window bounded by the chunk, so queries and raw data stay the size
+  of a chunk however long the gap. The last run time is saved after every
+  chunk, so an interrupted backfill resumes from the last chunk completed.
+  Alerts older than the backfill threshold are logged without notifications.
+
+  Returns the start of the remaining window, shorter than a chunk.
+  """
+  config = influx_fetcher.config
+  chunk = timedelta(minutes=config.backfill_chunk)
+  stale_before = current_run - timedelta(minutes=config.backfill_threshold)
+  logger.info(f"Shard {shard} is {current_run - last_run} behind, backfilling in chunks of {chunk}")
+
+  try:
+    while last_run + chunk <= current_run and not (lease and lease.lost):
+      chunk_end = last_run + chunk
+      influx_fetcher.window_end = chunk_end
+      logger.info(f"Backfilling shard {shard} from {last_run} to {chunk_end}")
+
+      device_manager = DeviceManager(influx_fetcher, influx_fetcher.tz)
+      # Catch-up windows say nothing about a device's reporting rate
+      device_manager.adaptive_polling = False
+      device_manager.prepare_cycle()
+      device_docs = [
+        device_doc for device_doc in load_device_snapshots()
+        if shard_of(device_doc.name, shard_count) == shard
+      ]
+      collect_window(device_manager, CollectionQueue(device_docs, device_manager.alerts.has_active), last_run, lease)
+      if lease and lease.lost:
+        break
+      device_manager.process_alerts(stale_before)
+
+      update_last_run_time(chunk_end, shard, shard_count)
+      last_run = chunk_end
+  finally:
+    influx_fetcher.window_end = None
+  return last_run
+
+def run_collection(shard: int = 0, shard_count: int = 1, lease: Optional[ShardLease] = None) -> None:
+  """Main function to collect and process InfluxDB data of a shard"""
   influx_fetcher = None
   try:
     # Get last run time and current time
-    last_run = get_last_run_time()
+    last_run = get_last_run_time(shard, shard_count)
     current_run = now_datetime()
     
-    logger.info(f"Starting data collection from {last_run} to {current_run}")
+    logger.info(f"Starting data collection of shard {shard}/{shard_count} from {last_run} to {current_run}")
 
     # Initialize components
     tz_handler = TimezoneHandler()
     influx_fetcher = InfluxDataFetcher(tz_handler)
-    device_manager = DeviceManager(influx_fetcher, tz_handler)
 
-    # Get active devices
-    devices = frappe.get_all(
-      'CN Device',
-      filters={'disabled': 0},
-      fields=['name', 'hostname']
-    )
-    
-    logger.info(f"Found {len(devices)} active devices")
+    backfill_threshold = influx_fetcher.config.backfill_threshold
+    if backfill_threshold and current_run - last_run >= timedelta(minutes=backfill_threshold):
+      last_run = backfill(influx_fetcher, last_run, current_run, shard, shard_count, lease)
+      if lease and lease.lost:
+        logger.error(f"Lease of shard {shard} lost while backfilling, left to its new holder")
+        return
 
-    for device in devices:
-      try:
-        logger.info(f"Processing device {device.name}")
-        device_doc = frappe.get_doc('CN Device', device.name)
-        device_manager.update_device_data(device_doc, last_run)
-      except Exception as e:
-        logger.error(f"Error processing device {device.name}: {str(e)}")
-        frappe.db.rollback()
-        continue
+    device_manager = DeviceManager(influx_fetcher, tz_handler)
+    device_manager.prepare_cycle()
+
+    # Get active devices of the shard with their data items and warning channels
+    device_docs = [
+      device_doc for device_doc in load_device_snapshots()
+      if shard_of(device_doc.name, shard_count) == shard
+    ]
+    if device_manager.adaptive_polling:
+      device_docs = [
+        device_doc for device_doc in device_docs
+        if device_manager.polls.is_due(device_doc.name, device_manager.alerts.has_active(device_doc.name))
+      ]
+    
+    logger.info(f"Found {len(device_docs)} active devices")
+
+    # Most urgent devices first, leaving what the budget does not cover to the next run
+    work = CollectionQueue(device_docs, device_manager.alerts.has_active, influx_fetcher.config.cycle_budget)
+    collect_window(device_manager, work, last_run, lease)
+    if lease and lease.lost:
+      # The new holder owns the shard's carryover, alerts and last run time
+      logger.error(f"Lease of shard {shard} lost, remaining devices left to its new holder")
+      return
+    work.save_carryover()
+    device_manager.process_alerts()
+    if device_manager.adaptive_polling:
+      device_manager.polls.save()
 
     # Update last run time
-    update_last_run_time(current_run)
+    update_last_run_time(current_run, shard, shard_count)
     logger.info("Successfully completed data collection")
 
   except Exception as e:
@@ -682,11 +1170,12 @@ def collect_influx_data() -> None:
     frappe.log_error(message=str(e), title="Data Collection Error")
     frappe.db.rollback()
   finally:
-    if influx_fetcher and influx_fetcher.client:
-      influx_fetcher.client.close()
+    if influx_fetcher:
+      influx_fetcher.release()
 
 def test_influx_connection():
   """Test function to verify InfluxDB connection and data retrieval"""
+  fetcher = None
   try:
     tz_handler = TimezoneHandler()
     fetcher = InfluxDataFetcher(tz_handler)
@@ -715,6 +1204,9 @@ def test_influx_connection():
   except Exception as e:
     logger.error(f"Test failed: {str(e)}")
     raise
+  finally:
+    if fetcher:
+      fetcher.release()
 
 if __name__ == "__main__":
   collect_influx_data()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import frappe
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pibiconnect.pibiconnect.metadata_cache import get_sensor_type
+
+logger = logging.getLogger(__name__)
+
+# Redis hash of device -> number of consecutive runs it was carried over
+CARRYOVER_KEY = "pibiconnect:collect_carryover"
+
+# Priority classes, lowest first
+PRIORITY_ALERTING = 0
+PRIORITY_CRITICAL = 1
+PRIORITY_NORMAL = 2
+
+class CollectionQueue:
+  """Devices of a collection run in priority order, within a time budget.
+
+  Devices with open alerts go first, then devices of critical sensor types,
+  then the rest; within a class, devices carried over from earlier runs and
+  then those with the oldest `last_recorded` go first. Each run a device is
+  carried over raises it one class, so no device waits more than two runs
+  behind the others. Once the budget is spent the queue stops handing out
+  devices and the rest are carried over to the next run.
+  """
+  def __init__(self, device_docs: List['frappe._dict'], is_alerting: Callable[[str], bool],
+               budget_seconds: int = 0):
+    self._lock = threading.Lock()
+    self.deadline = time.monotonic() + budget_seconds if budget_seconds else None
+    self.carryover = self._load_carryover()
+    self._heap = []
+    self.processed: List[str] = []
+    for device_doc in device_docs:
+      heapq.heappush(self._heap, (self.priority(device_doc, is_alerting), device_doc.name, device_doc))
+
+  @staticmethod
+  def _load_carryover() -> Dict[str, int]:
+    try:
+      return frappe.cache().hgetall(CARRYOVER_KEY) or {}
+    except Exception as e:
+      logger.error(f"Error loading carried over devices: {str(e)}")
+      return {}
+
+  def priority(self, device_doc: 'frappe._dict', is_alerting: Callable[[str], bool]) -> tuple:
+    if is_alerting(device_doc.name):
+      base = PRIORITY_ALERTING
+    elif get_sensor_type(device_doc.get('sensor_type')).get('critical'):
+      base = PRIORITY_CRITICAL
+    else:
+      base = PRIORITY_NORMAL
+    carried = int(self.carryover.get(device_doc.name) or 0)
+    # A series never recorded counts as the stalest
+    recorded = [item.last_recorded for item in device_doc.get('data_item') or []]
+    stalest = min((r or datetime.min for r in recorded), default=datetime.min)
+    return (max(base - carried, PRIORITY_ALERTING), -carried, stalest)
+
+  def __len__(self) -> int:
+    return len(self._heap)
+
+  @property
+  def expired(self) -> bool:
+    return self.deadline is not None and time.monotonic() >= self.deadline
+
+  def pop(self) -> Optional['frappe._dict']:
+    """Next device to process, or None when the queue is empty or out of time"""
+    with self._lock:
+      if not self._heap or self.expired:
+        return None
+      device_doc = heapq.heappop(self._heap)[-1]
+      self.processed.append(device_doc.name)
+      return device_doc
+
+  def devices(self) -> List['frappe._dict']:
+    """Devices still queued, in priority order"""
+    with self._lock:
+      return [entry[-1] for entry in sorted(self._heap, key=lambda entry: entry[:2])]
+
+  def remaining(self) -> List[str]:
+    with self._lock:
+      return [entry[1] for entry in sorted(self._heap)]
+
+  def save_carryover(self) -> None:
+    """Record the devices left in the queue and clear those processed this run"""
+    remaining = self.remaining()
+    try:
+      cache = frappe.cache()
+      for device_name in self.processed:
+        if device_name in self.carryover:
+          cache.hdel(CARRYOVER_KEY, device_name)
+      for device_name in remaining:
+        cache.hset(CARRYOVER_KEY, device_name, int(self.carryover.get(device_name) or 0) + 1)
+    except Exception as e:
+      logger.error(f"Error saving carried over devices: {str(e)}")
+    if remaining:
+      logger.warning(f"{len(remaining)} devices carried over to the next run")
@@ -0,0 +1,59 @@
+import frappe
+from typing import Dict, List
+
+DEVICE_FIELDS = ['name', 'hostname', 'alias', 'place', 'sensor_type', 'connected', 'store_raw_data']
+DATA_ITEM_FIELDS = ['name', 'parent', 'sensor_var', 'uom', 'last_recorded', 'value', 'reading']
+
+def load_device_snapshots() -> List['frappe._dict']:
+  """Enabled CN Devices with their data items and active warning channels.
+
+  The whole fleet is read with three set-based queries instead of one document
+  load per device. Snapshots are meant to be read during a single cycle; only
+  the running `reading` count of their data items is updated in memory.
+  """
+  devices = frappe.get_all('CN Device', filters={'disabled': 0}, fields=DEVICE_FIELDS, order_by='name asc')
+  by_name: Dict[str, 'frappe._dict'] = {}
+  for device in devices:
+    device.data_item = []
+    device.warning_channels = []
+    by_name[device.name] = device
+
+  data_items = frappe.get_all(
+    'CN Data Item',
+    filters={'parenttype': 'CN Device', 'parentfield': 'data_item'},
+    fields=DATA_ITEM_FIELDS,
+    order_by='parent asc, idx asc',
+    parent_doctype='CN Device'
+  )
+  for data_item in data_items:
+    device = by_name.get(data_item.parent)
+    if device is not None:
+      device.data_item.append(data_item)
+
+  channels = frappe.get_all(
+    'CN Warning Item',
+    filters={'parenttype': 'CN Device', 'parentfield': 'warning_item', 'active': 1},
+    fields=['parent', 'channel_type', 'email', 'mobile'],
+    order_by='parent asc, idx asc',
+    parent_doctype='CN Device'
+  )
+  for channel in channels:
+    device = by_name.get(channel.parent)
+    if device is not None:
+      device.warning_channels.append(frappe._dict(
+        channel_type=channel.channel_type, email=channel.email, mobile=channel.mobile
+      ))
+
+  return devices
+
+def load_device_logs(date) -> Dict[str, List]:
+  """Name and last log item idx of each device's CN Device Log of `date`"""
+  rows = frappe.db.sql("""
+    SELECT log.name, log.device, MAX(item.idx) AS last_idx
+    FROM `tabCN Device Log` AS log
+    LEFT JOIN `tabCN Log Item` AS item
+      ON item.parent = log.name AND item.parenttype = 'CN Device Log' AND item.parentfield = 'log_item'
+    WHERE log.date = %s
+    GROUP BY log.name, log.device
+  """, date, as_dict=True)
+  return {row.device: [row.name, row.last_idx or 0] for row in rows}
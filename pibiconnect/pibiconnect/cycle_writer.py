@@ -0,0 +1,219 @@
+import frappe
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from frappe.utils import now_datetime
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row UPDATE statement
+UPDATE_CHUNK_SIZE = 500
+
+class _Batch:
+  """Pending updates, inserts and child rows"""
+  __slots__ = ('updates', 'inserts', 'rows')
+
+  def __init__(self):
+    self.updates: Dict[Tuple[str, str], Dict] = {}
+    self.inserts: Dict[Tuple[str, str], Dict] = {}
+    self.rows: Dict[str, List[Dict]] = {}
+
+  def __len__(self) -> int:
+    return len(self.updates) + len(self.inserts) + sum(len(rows) for rows in self.rows.values())
+
+  def update(self, key: Tuple[str, str], values: Dict) -> None:
+    if key in self.inserts:
+      self.inserts[key].update(values)
+    else:
+      self.updates.setdefault(key, {}).update(values)
+
+  def insert(self, key: Tuple[str, str], values: Dict) -> None:
+    self.inserts.setdefault(key, {}).update(values)
+
+  def add_row(self, doctype: str, row: Dict) -> None:
+    self.rows.setdefault(doctype, []).append(row)
+
+  def merge(self, other: '_Batch') -> None:
+    for key, values in other.inserts.items():
+      self.insert(key, values)
+    for key, values in other.updates.items():
+      self.update(key, values)
+    for doctype, rows in other.rows.items():
+      self.rows.setdefault(doctype, []).extend(rows)
+
+class CycleWriter:
+  """Write stage of a collection cycle.
+
+  Updates are merged per row and flushed together: one multi-row UPDATE per
+  doctype and field set, new documents inserted, child rows bulk inserted under
+  their existing parents, then a single commit for the whole batch. Worker
+  threads share one writer; whichever thread fills the batch flushes it on its
+  own connection. Writes made inside `unit()` join the batch only when the
+  block ends, so a flush holds either all or none of them.
+  """
+  def __init__(self, batch_size: int = 500):
+    self.batch_size = max(int(batch_size or 0), 1)
+    self._lock = threading.RLock()
+    self._batch = _Batch()
+    self._local = threading.local()
+
+  def __len__(self) -> int:
+    return len(self._batch)
+
+  @contextmanager
+  def unit(self):
+    """Hold back the writes of this thread until the block ends.
+
+    They are added to the shared batch together, or dropped if the block raises
+    or calls `discard()`.
+    """
+    self._local.unit = _Batch()
+    try:
+      yield
+      unit = self._local.unit
+    finally:
+      self._local.unit = None
+    with self._lock:
+      self._batch.merge(unit)
+
+  def discard(self) -> None:
+    """Drop the writes held back by the current unit of this thread"""
+    if self._unit() is not None:
+      self._local.unit = _Batch()
+
+  def _unit(self) -> Optional[_Batch]:
+    return getattr(self._local, 'unit', None)
+
+  def update(self, doctype: str, name: str, values: Dict) -> None:
+    """Queue column updates for an existing row, merged with earlier ones"""
+    unit = self._unit()
+    if unit is not None:
+      unit.update((doctype, name), values)
+      return
+    with self._lock:
+      self._batch.update((doctype, name), values)
+
+  def insert(self, doctype: str, name: str, values: Dict) -> None:
+    """Queue a new document; later updates to the same name are merged into it"""
+    unit = self._unit()
+    if unit is not None:
+      unit.insert((doctype, name), values)
+      return
+    with self._lock:
+      self._batch.insert((doctype, name), values)
+
+  def insert_child(self, doctype: str, parenttype: str, parent: str, parentfield: str,
+                   idx: int, values: Dict) -> None:
+    """Queue a child row for direct insertion under an existing parent.
+
+    The parent document is neither loaded nor saved, so the cost does not grow
+    with the size of its child table.
+    """
+    now = now_datetime()
+    row = dict(
+      values,
+      name=frappe.generate_hash(length=10),
+      parent=parent,
+      parenttype=parenttype,
+      parentfield=parentfield,
+      idx=idx,
+      docstatus=0,
+      creation=now,
+      modified=now,
+      owner=frappe.session.user,
+      modified_by=frappe.session.user
+    )
+    unit = self._unit()
+    if unit is not None:
+      unit.add_row(doctype, row)
+      return
+    with self._lock:
+      self._batch.add_row(doctype, row)
+
+  def flush_if_full(self) -> None:
+    if len(self) >= self.batch_size:
+      self.flush()
+
+  def flush(self) -> None:
+    """Write every pending change and commit once"""
+    with self._lock:
+      if not len(self):
+        return
+      batch, self._batch = self._batch, _Batch()
+      updates, inserts, children = batch.updates, batch.inserts, batch.rows
+
+      try:
+        for (doctype, _name), values in inserts.items():
+          self._insert(doctype, values)
+
+        for doctype, child_rows in children.items():
+          fields = sorted(set().union(*child_rows))
+          frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in child_rows])
+
+        groups: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[str, Dict]]] = {}
+        for (doctype, name), values in updates.items():
+          groups.setdefault((doctype, tuple(sorted(values))), []).append((name, values))
+        for (doctype, fields), rows in groups.items():
+          for offset in range(0, len(rows), UPDATE_CHUNK_SIZE):
+            self._bulk_update(doctype, fields, rows[offset:offset + UPDATE_CHUNK_SIZE])
+
+        frappe.db.commit()
+        logger.info(
+          f"Flushed {len(updates)} updates, {len(inserts)} inserts and "
+          f"{sum(len(child_rows) for child_rows in children.values())} child rows"
+        )
+      except Exception as e:
+        frappe.db.rollback()
+        logger.error(f"Error flushing collection writes, retrying row by row: {str(e)}")
+        self._flush_rows(updates, inserts, children)
+
+  def _flush_rows(self, updates: Dict[Tuple[str, str], Dict], inserts: Dict[Tuple[str, str], Dict],
+                  children: Dict[str, List[Dict]]) -> None:
+    """Write a failed batch one row at a time, so a bad row loses only itself"""
+    results = []
+    for (doctype, name), values in inserts.items():
+      results.append(self._write_row(doctype, name, self._insert, doctype, values))
+    for doctype, child_rows in children.items():
+      for row in child_rows:
+        fields = sorted(row)
+        results.append(self._write_row(
+          doctype, row['name'], frappe.db.bulk_insert, doctype, fields, [[row[field] for field in fields]]
+        ))
+    for (doctype, name), values in updates.items():
+      results.append(self._write_row(doctype, name, self._bulk_update, doctype, tuple(sorted(values)), [(name, values)]))
+    logger.info(f"Flushed {sum(results)} of {len(results)} rows one by one")
+
+  @staticmethod
+  def _write_row(doctype: str, name: str, write, *args) -> bool:
+    """Write and commit a single row, logging it when it fails"""
+    try:
+      write(*args)
+      frappe.db.commit()
+      return True
+    except Exception as e:
+      frappe.db.rollback()
+      logger.error(f"Error writing {doctype} {name}: {str(e)}")
+      frappe.log_error(message=frappe.get_traceback(), title=f"Collection Write Error - {doctype} {name}")
+      return False
+
+  @staticmethod
+  def _insert(doctype: str, values: Dict) -> None:
+    frappe.get_doc(dict(values, doctype=doctype)).insert(ignore_permissions=True)
+
+  def _bulk_update(self, doctype: str, fields: Tuple[str, ...], rows: List[Tuple[str, Dict]]) -> None:
+    """Update many rows of a table with one statement"""
+    assignments = []
+    params = []
+    for field in fields:
+      cases = ' '.join(['WHEN %s THEN %s'] * len(rows))
+      assignments.append(f"`{field}` = CASE `name` {cases} ELSE `{field}` END")
+      for name, values in rows:
+        params.extend([name, values[field]])
+
+    names = [name for name, _ in rows]
+    placeholders = ', '.join(['%s'] * len(names))
+    frappe.db.sql(
+      f"UPDATE `tab{doctype}` SET {', '.join(assignments)} WHERE `name` IN ({placeholders})",
+      params + names
+    )
@@ -10,6 +10,53 @@ frappe.ui.form.on('CN Device Log', {
     }
 });
 
+frappe.ui.form.on('CN Log Item', {
+    form_render: function(frm, cdt, cdn) {
+        // Raw data is stored encoded, show it decoded
+        show_raw_data(frm, cdn);
+    }
+});
+
+function show_raw_data(frm, cdn) {
+  const row = locals['CN Log Item'][cdn];
+  const wrapper = frm.fields_dict.log_item.grid.grid_rows_by_docname[cdn].grid_form.fields_dict.raw_data_html.$wrapper;
+  wrapper.empty();
+  if (!row.raw_data || row.__islocal) return;
+
+  frappe.call({
+    method: "pibiconnect.pibiconnect.api.get_log_item_raw_data",
+    args: {
+      'log_item': cdn
+    },
+    callback: function(r) {
+      if (!r.message || !Array.isArray(r.message)) return;
+
+      const has_raw = r.message.some(reading => reading.raw_value !== undefined && reading.raw_value !== null);
+      const rows = r.message.map(reading => `
+        <tr>
+          <td>${frappe.datetime.str_to_user(reading.timestamp)}</td>
+          <td>${reading.value}</td>
+          ${has_raw ? `<td>${reading.raw_value}</td>` : ''}
+        </tr>`).join('');
+
+      wrapper.html(`
+        <label class="control-label">${__('Raw Data')}</label>
+        <div style="max-height: 300px; overflow-y: auto;">
+          <table class="table table-bordered table-condensed">
+            <thead>
+              <tr>
+                <th>${__('Time')}</th>
+                <th>${__('Value')}</th>
+                ${has_raw ? `<th>${__('Raw Value')}</th>` : ''}
+              </tr>
+            </thead>
+            <tbody>${rows}</tbody>
+          </table>
+        </div>`);
+    }
+  });
+}
+
 function create_chart(frm) {
   frappe.call({
     method: "pibiconnect.pibiconnect.custom.get_chart",
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, pibiCo and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("CN Series Cursor", {
+// 	refresh(frm) {
+
+// 	},
+// });
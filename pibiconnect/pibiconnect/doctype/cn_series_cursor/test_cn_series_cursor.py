@@ -0,0 +1,68 @@
+# Copyright (c) 2026, pibiCo and Contributors
+# See license.txt
+
+# import frappe
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.flux_stream import SeriesArrays
+from pibiconnect.pibiconnect.series_cursor import SeriesCursor, SeriesCursorStore
+
+
+class TestCNSeriesCursor(FrappeTestCase):
+	def test_fresh_cursor_accepts_everything(self):
+		cursor = SeriesCursor('DEV-1', 'temp')
+		self.assertTrue(cursor.is_new(0, 500))
+		self.assertIsNone(cursor.start_time(500))
+
+	def test_is_new_within_lateness(self):
+		cursor = SeriesCursor('DEV-1', 'temp', 1000, [900, 1000])
+		self.assertTrue(cursor.is_new(1001, 500))
+		self.assertFalse(cursor.is_new(1000, 500))
+		self.assertFalse(cursor.is_new(900, 500))
+		# Late but inside the window and not ingested yet
+		self.assertTrue(cursor.is_new(950, 500))
+		# Older than the lateness window
+		self.assertFalse(cursor.is_new(500, 500))
+		self.assertFalse(cursor.is_new(400, 500))
+
+	def test_seeded_cursor_rejects_points_up_to_watermark(self):
+		cursor = SeriesCursor('DEV-1', 'temp', 1000)
+		self.assertFalse(cursor.is_new(1000, 500))
+		self.assertFalse(cursor.is_new(950, 500))
+		self.assertTrue(cursor.is_new(1001, 500))
+
+	def test_advance_moves_watermark_and_trims_recent(self):
+		cursor = SeriesCursor('DEV-1', 'temp', 1000, [600, 900, 1000])
+		cursor.advance([1200, 1100], 500)
+		self.assertEqual(cursor.watermark, 1200)
+		self.assertEqual(cursor.recent, {900, 1000, 1100, 1200})
+
+		# Late points are remembered without moving the watermark back
+		cursor.advance([800], 500)
+		self.assertEqual(cursor.watermark, 1200)
+		self.assertEqual(cursor.recent, {800, 900, 1000, 1100, 1200})
+		self.assertFalse(cursor.is_new(800, 500))
+
+	def test_advance_without_points_or_lateness(self):
+		cursor = SeriesCursor('DEV-1', 'temp', 1000, [1000])
+		cursor.advance([], 500)
+		self.assertEqual(cursor.watermark, 1000)
+		self.assertEqual(cursor.recent, {1000})
+
+		cursor.advance([1500], 0)
+		self.assertEqual(cursor.watermark, 1500)
+		self.assertEqual(cursor.recent, set())
+
+	def test_filter_new(self):
+		store = SeriesCursorStore(None, lateness_seconds=0)
+		store.lateness_us = 500
+		cursor = SeriesCursor('DEV-1', 'temp', 1000, [900, 1000])
+		series = SeriesArrays()
+		for time_us, value in ((400, 1.0), (900, 2.0), (950, 3.0), (1000, 4.0), (1100, 5.0)):
+			series.append(time_us, value)
+
+		filtered = store.filter_new(cursor, series)
+		self.assertEqual(list(filtered.times), [950, 1100])
+		self.assertEqual(list(filtered.values), [3.0, 5.0])
+		# Series entirely past the watermark are passed through untouched
+		later = filtered.since(1001)
+		self.assertIs(store.filter_new(cursor, later), later)
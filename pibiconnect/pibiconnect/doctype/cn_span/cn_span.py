@@ -2,27 +2,42 @@
 # For license information, please see license.txt
 
 import frappe
+from frappe import _
 from frappe.model.document import Document
+from pibiconnect.pibiconnect.span_table import (
+    DEFAULT_SCALE, SCALE_RANGES, CompiledSpan, parse_coefficients
+)
 
 class CNSpan(Document):
     def validate(self):
+        self.validate_curve()
+
         if not self.higher_span and not self.lower_span:
             self.span_factor = 1
             return
-            
+
+        input_min, input_max = SCALE_RANGES.get(self.scale or DEFAULT_SCALE, SCALE_RANGES[DEFAULT_SCALE])
         value_range = self.higher_span - self.lower_span
-        self.span_factor = value_range / 10
-        
+        self.span_factor = value_range / (input_max - input_min)
+
+    def validate_curve(self):
+        if self.curve_type == "Piecewise":
+            inputs = [point.input_value for point in self.calibration_points]
+            if len(inputs) < 2:
+                frappe.throw(_("A piecewise curve needs at least two calibration points"))
+            if len(set(inputs)) != len(inputs):
+                frappe.throw(_("Calibration points must have different input values"))
+            self.calibration_points.sort(key=lambda point: point.input_value)
+            for idx, point in enumerate(self.calibration_points, start=1):
+                point.idx = idx
+        elif self.curve_type == "Polynomial":
+            if not parse_coefficients(self.coefficients):
+                frappe.throw(_("A polynomial curve needs at least one coefficient"))
+
     def calculate_reading(self, voltage):
         """
-        Calculate sensor reading from voltage input (0-10V)
-        If no spans defined, returns raw voltage value
-        Includes calibration factor offset of 0.30V
+        Calculate sensor reading from the input signal (0-10V or 4-20mA)
+        using the linear span, calibration points or polynomial of the curve type.
+        If no curve is defined, returns the raw input value
         """
-        if not self.higher_span and not self.lower_span:
-            return voltage
-            
-        calibration_factor = 0.00
-        adjusted_voltage = max(0, voltage - calibration_factor)
-        
-        return self.lower_span + (adjusted_voltage * self.span_factor)
\ No newline at end of file
+        return float(CompiledSpan.from_doc(self).apply(voltage))
@@ -0,0 +1,93 @@
+import frappe
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CATALOG_KEY = "pibiconnect:influx_field_catalog"
+# A device reporting a field we do not know yet is rediscovered at most this often
+RECHECK_SECONDS = 300
+
+class FieldCatalog:
+  """Cached InfluxDB field names per hostname.
+
+  Entries live in a Redis hash so every worker process shares them. A cycle
+  primes the catalog once, rediscovering stale hostnames with a single grouped
+  query, and then reads from memory.
+  """
+  def __init__(self, influx_fetcher, ttl_seconds: int = 3600):
+    self.influx = influx_fetcher
+    self.ttl = max(int(ttl_seconds or 0), 0)
+    self._entries: Dict[str, Dict] = {}
+
+  def prime(self, wanted: Dict[str, Iterable[str]]) -> None:
+    """Load the catalog and refresh hostnames that are stale or miss a wanted field"""
+    try:
+      self._entries = frappe.cache().hgetall(CATALOG_KEY) or {}
+    except Exception as e:
+      logger.error(f"Error reading field catalog: {str(e)}")
+      self._entries = {}
+
+    now = time.time()
+    stale = [
+      hostname for hostname, fields in wanted.items()
+      if self._is_stale(self._entries.get(hostname), set(fields), now)
+    ]
+    if stale:
+      self._refresh(stale)
+
+  def get(self, hostname: str) -> List[str]:
+    """Known fields of a hostname, discovering it when it is not in the catalog"""
+    entry = self._entries.get(hostname)
+    if entry is None:
+      self._refresh([hostname])
+      entry = self._entries.get(hostname, {})
+    return entry.get('fields', [])
+
+  def invalidate(self, hostname: Optional[str] = None) -> None:
+    """Drop one hostname, or the whole catalog, so it is rediscovered next cycle"""
+    if hostname:
+      self._entries.pop(hostname, None)
+    else:
+      self._entries.clear()
+    invalidate_field_catalog(hostname)
+
+  def _is_stale(self, entry: Optional[Dict], wanted: set, now: float) -> bool:
+    if not entry:
+      return True
+    age = now - entry.get('checked', 0)
+    if age >= self.ttl:
+      return True
+    return not wanted.issubset(entry.get('fields', [])) and age >= RECHECK_SECONDS
+
+  def _refresh(self, hostnames: List[str]) -> None:
+    discovered = self.influx.discover_fields(hostnames)
+    if discovered is None:
+      return
+    now = time.time()
+    for hostname in hostnames:
+      entry = {'fields': [field.lower() for field in discovered.get(hostname, [])], 'checked': now}
+      self._entries[hostname] = entry
+      try:
+        frappe.cache().hset(CATALOG_KEY, hostname, entry)
+      except Exception as e:
+        logger.error(f"Error caching fields for {hostname}: {str(e)}")
+
+def invalidate_field_catalog(hostname: Optional[str] = None) -> None:
+  """Forget cached fields for a hostname, or for every hostname"""
+  try:
+    if hostname:
+      frappe.cache().hdel(CATALOG_KEY, hostname)
+    else:
+      frappe.cache().delete_value(CATALOG_KEY)
+  except Exception as e:
+    logger.error(f"Error invalidating field catalog: {str(e)}")
+
+def on_device_update(doc, method=None):
+  """Rediscover a device's fields when its hostname or data items change"""
+  old_doc = doc.get_doc_before_save()
+  if old_doc and old_doc.hostname and old_doc.hostname != doc.hostname:
+    invalidate_field_catalog(old_doc.hostname)
+  if doc.hostname:
+    invalidate_field_catalog(doc.hostname)
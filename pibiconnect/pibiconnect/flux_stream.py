@@ -0,0 +1,99 @@
+import calendar
+import math
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+class SeriesArrays:
+  """Columnar readings of one series.
+
+  Timestamps are UTC epoch microseconds (int64) and values are float64, with
+  NaN standing for a point whose value is not numeric. Timezone conversion is
+  left to whoever outputs the timestamps.
+  """
+  __slots__ = ('times', 'values')
+
+  def __init__(self, times: array = None, values: array = None):
+    self.times = times if times is not None else array('q')
+    self.values = values if values is not None else array('d')
+
+  def __len__(self) -> int:
+    return len(self.times)
+
+  def append(self, time_us: int, value: float) -> None:
+    self.times.append(time_us)
+    self.values.append(value)
+
+  def select(self, keep: Iterable[bool]) -> 'SeriesArrays':
+    """Copy of the points for which `keep` is true"""
+    selected = SeriesArrays()
+    for time_us, value, flag in zip(self.times, self.values, keep, strict=True):
+      if flag:
+        selected.append(time_us, value)
+    return selected
+
+  def since(self, start_us: int) -> 'SeriesArrays':
+    """Copy of the points at or after `start_us`"""
+    if not self.times or self.times[0] >= start_us:
+      return self
+    return self.select(time_us >= start_us for time_us in self.times)
+
+  def sort(self) -> None:
+    """Order points by time when several tables were merged into one series"""
+    if all(a <= b for a, b in zip(self.times[:-1], self.times[1:], strict=True)):
+      return
+    order = sorted(range(len(self.times)), key=self.times.__getitem__)
+    self.times = array('q', (self.times[i] for i in order))
+    self.values = array('d', (self.values[i] for i in order))
+
+def parse_time_us(value: str) -> int:
+  """Epoch microseconds of an RFC3339 UTC timestamp as written by InfluxDB"""
+  seconds = calendar.timegm((
+    int(value[0:4]), int(value[5:7]), int(value[8:10]),
+    int(value[11:13]), int(value[14:16]), int(value[17:19])
+  ))
+  micros = 0
+  if len(value) > 20 and value[19] == '.':
+    fraction = value[20:].rstrip('Z')
+    micros = int((fraction + '000000')[:6])
+  return seconds * 1000000 + micros
+
+def parse_value(value: str) -> float:
+  """Float value of a CSV cell, NaN when it is not numeric"""
+  try:
+    return float(value)
+  except ValueError:
+    return math.nan
+
+def parse_flux_csv(rows: Iterable[List[str]], key_columns: Tuple[str, ...] = ()) -> Dict[Tuple, SeriesArrays]:
+  """Stream annotation-free Flux CSV rows into columnar series keyed by `key_columns`.
+
+  Rows are consumed one at a time, so no intermediate record objects are built.
+  A blank row ends a table and the next row is the header of the following one.
+  """
+  series: Dict[Tuple, SeriesArrays] = {}
+  header = None
+  time_idx = value_idx = 0
+  key_idx: List[int] = []
+
+  for row in rows:
+    if not row or not any(row):
+      header = None
+      continue
+    if header is None:
+      header = {name: idx for idx, name in enumerate(row)}
+      if 'error' in header and '_time' not in header:
+        raise ValueError(f"InfluxDB query error: {row}")
+      time_idx = header['_time']
+      value_idx = header['_value']
+      key_idx = [header[column] for column in key_columns]
+      continue
+
+    key = tuple(row[idx] for idx in key_idx)
+    target = series.get(key)
+    if target is None:
+      target = series[key] = SeriesArrays()
+    target.append(parse_time_us(row[time_idx]), parse_value(row[value_idx]))
+
+  for target in series.values():
+    target.sort()
+  return series
@@ -0,0 +1,122 @@
+import frappe
+import logging
+import threading
+from influxdb_client import InfluxDBClient
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever CN Connect Settings is saved, so every process rebuilds its client
+SETTINGS_VERSION_KEY = "pibiconnect:influx_settings_version"
+# Connections kept per client beyond one per collection worker
+POOL_HEADROOM = 2
+
+class InfluxDBConfig:
+  """Class to manage InfluxDB configuration"""
+  def __init__(self):
+    self.settings = frappe.get_single('CN Connect Settings')
+    self.url = self.settings.influxdb_url
+    self.token = self.settings.get_password('influxdb_token')
+    self.bucket = self.settings.influxdb_bucket
+    self.org = self.settings.influxdb_org
+    self.fetch_mode = self.settings.fetch_mode or 'Per Device'
+    self.fleet_batch_size = int(self.settings.fleet_query_batch_size or 250)
+    self.workers = max(int(self.settings.collection_workers or 1), 1)
+    self.lateness_window = int(self.settings.lateness_window or 0)
+    self.field_catalog_ttl = int(self.settings.field_catalog_ttl or 3600)
+    self.aggregation_pushdown = bool(self.settings.aggregation_pushdown)
+    self.write_batch_size = int(self.settings.write_batch_size or 500)
+    self.adaptive_polling = bool(self.settings.adaptive_polling)
+    self.cycle_budget = int(self.settings.cycle_budget or 0)
+    self.backfill_threshold = int(self.settings.backfill_threshold or 0)
+    self.backfill_chunk = max(int(self.settings.backfill_chunk or 30), 1)
+    self.query_timeout = max(int(self.settings.query_timeout or 30), 1)
+    self.breaker_threshold = max(int(self.settings.breaker_threshold or 3), 1)
+    self.breaker_cooloff = int(self.settings.breaker_cooloff or 15) * 60
+    self.validate()
+
+  def validate(self) -> None:
+    """Validate that all required configuration values are present"""
+    missing = []
+    for attr in ['url', 'token', 'bucket', 'org']:
+      if not getattr(self, attr):
+        missing.append(attr)
+    if missing:
+      raise ValueError(f"Missing InfluxDB configuration in CN Connect Settings: {', '.join(missing)}")
+
+_lock = threading.Lock()
+# site -> current entry of this process: version, config, client and users
+_clients: Dict[str, Dict] = {}
+# Replaced entries still used by a running cycle
+_retired: List[Dict] = []
+
+def get_influx_client() -> Tuple[InfluxDBConfig, InfluxDBClient]:
+  """Configuration and pooled InfluxDB client of the current site.
+
+  Both are built once per process and reused by every cycle, keeping
+  connections alive between runs; they are rebuilt only after CN Connect
+  Settings changes. Responses are gzip-compressed and the connection pool is
+  sized for the collection workers. Each call must be paired with
+  release_influx_client once the cycle is done with the client.
+  """
+  site = frappe.local.site
+  try:
+    version = frappe.cache().get_value(SETTINGS_VERSION_KEY)
+    if version is None:
+      version = frappe.generate_hash(length=10)
+      frappe.cache().set_value(SETTINGS_VERSION_KEY, version)
+  except Exception as e:
+    logger.error(f"Error reading InfluxDB settings version: {str(e)}")
+    version = None
+
+  with _lock:
+    entry = _clients.get(site)
+    if entry and version is not None and entry['version'] == version:
+      entry['users'] += 1
+      return entry['config'], entry['client']
+
+    config = InfluxDBConfig()
+    client = InfluxDBClient(
+      url=config.url,
+      token=config.token,
+      org=config.org,
+      timeout=config.query_timeout * 1000,
+      enable_gzip=True,
+      connection_pool_maxsize=config.workers + POOL_HEADROOM
+    )
+    _clients[site] = {'version': version, 'config': config, 'client': client, 'users': 1}
+    if entry:
+      _retire(entry)
+  logger.info(f"InfluxDB client for {site} initialized")
+  return config, client
+
+def release_influx_client(client: InfluxDBClient) -> None:
+  """Give back a client from get_influx_client, closing it if it was replaced meanwhile"""
+  with _lock:
+    for entry in list(_clients.values()) + _retired:
+      if entry['client'] is client:
+        entry['users'] -= 1
+        if entry in _retired and not entry['users']:
+          _retired.remove(entry)
+          _close(entry)
+        return
+
+def _retire(entry: Dict) -> None:
+  """Close a replaced entry now, or when its last user releases it"""
+  if entry['users']:
+    _retired.append(entry)
+  else:
+    _close(entry)
+
+def _close(entry: Dict) -> None:
+  try:
+    entry['client'].close()
+  except Exception as e:
+    logger.error(f"Error closing InfluxDB client: {str(e)}")
+
+def on_settings_update(doc, method=None):
+  """doc_events hook of CN Connect Settings: rebuild the clients of every process"""
+  try:
+    frappe.cache().set_value(SETTINGS_VERSION_KEY, frappe.generate_hash(length=10))
+  except Exception as e:
+    logger.error(f"Error invalidating InfluxDB clients: {str(e)}")
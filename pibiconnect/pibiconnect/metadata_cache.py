@@ -0,0 +1,121 @@
+import frappe
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "pibiconnect:metadata:"
+# Entries kept by each process; other processes see an invalidation once
+# their copy expires
+LOCAL_TTL_SECONDS = 60
+LOCAL_MAX_ENTRIES = 32
+
+class _LocalTier:
+  """Small thread-safe LRU with expiry, in front of Redis"""
+  def __init__(self, max_entries: int, ttl_seconds: int):
+    self.max_entries = max_entries
+    self.ttl = ttl_seconds
+    self._lock = threading.Lock()
+    self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+  def get(self, key: tuple):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      if time.monotonic() - entry[1] >= self.ttl:
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return entry[0]
+
+  def set(self, key: tuple, value) -> None:
+    with self._lock:
+      self._entries[key] = (value, time.monotonic())
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+
+_local = _LocalTier(LOCAL_MAX_ENTRIES, LOCAL_TTL_SECONDS)
+
+def _load_sensor_vars() -> Dict[str, Dict]:
+  return {
+    row.name.lower(): row
+    for row in frappe.get_all(
+      'CN Sensor Var',
+      fields=['name', 'title', 'uom', 'chart_type', 'aggregator', 'aggregator_param']
+    )
+  }
+
+def _load_sensor_types() -> Dict[str, Dict]:
+  sensor_types = {
+    row.name.lower(): frappe._dict(row, sensor_vars=[])
+    for row in frappe.get_all('CN Sensor Type', fields=['name', 'title', 'description', 'critical'])
+  }
+  var_items = frappe.get_all(
+    'CN Var Item',
+    filters={'parenttype': 'CN Sensor Type'},
+    fields=['parent', 'sensor_var'],
+    order_by='parent asc, idx asc',
+    parent_doctype='CN Sensor Type'
+  )
+  for item in var_items:
+    sensor_type = sensor_types.get(item.parent.lower())
+    if sensor_type is not None and item.sensor_var:
+      sensor_type.sensor_vars.append(item.sensor_var)
+  return sensor_types
+
+LOADERS: Dict[str, Callable[[], Dict[str, Dict]]] = {
+  'sensor_var': _load_sensor_vars,
+  'sensor_type': _load_sensor_types
+}
+
+def _get_map(kind: str) -> Dict[str, Dict]:
+  """Every row of a metadata kind keyed by lowercase name, from the nearest tier"""
+  # Workers of a multi-site bench serve several sites from one process
+  local_key = (frappe.local.site, kind)
+  value = _local.get(local_key)
+  if value is not None:
+    return value
+  try:
+    value = frappe.cache().get_value(CACHE_KEY_PREFIX + kind, generator=LOADERS[kind])
+  except Exception as e:
+    logger.error(f"Error reading {kind} metadata cache: {str(e)}")
+    value = LOADERS[kind]()
+  _local.set(local_key, value)
+  return value
+
+def get_sensor_vars() -> Dict[str, Dict]:
+  """CN Sensor Var metadata keyed by lowercase name"""
+  return _get_map('sensor_var')
+
+def get_sensor_var(name: Optional[str]) -> Dict:
+  """Metadata of a CN Sensor Var, empty when it does not exist"""
+  return get_sensor_vars().get((name or '').lower(), {})
+
+def get_sensor_type(name: Optional[str]) -> Dict:
+  """Metadata of a CN Sensor Type with the names of its sensor vars"""
+  return _get_map('sensor_type').get((name or '').lower(), {})
+
+def invalidate_metadata() -> None:
+  """Drop every metadata kind from Redis and from this process"""
+  _local.clear()
+  try:
+    for kind in LOADERS:
+      frappe.cache().delete_value(CACHE_KEY_PREFIX + kind)
+  except Exception as e:
+    logger.error(f"Error invalidating metadata cache: {str(e)}")
+
+def on_metadata_change(doc, method=None, *args, **kwargs):
+  """doc_events hook of CN Sensor Var, CN UOM and CN Sensor Type.
+
+  Kinds reference each other by name, so any change drops all of them.
+  """
+  invalidate_metadata()
@@ -0,0 +1,242 @@
+import frappe
+import json
+import logging
+import time
+from frappe import _
+from frappe.utils import nowdate
+from frappe.core.doctype.sms_settings.sms_settings import get_headers, send_request, validate_receiver_nos
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Redis list of pending notifications, drained every minute by dispatch_notifications
+OUTBOX_KEY = "pibiconnect:notification_outbox"
+
+# Recipients handed to the gateway in one call
+RECIPIENT_BATCH_SIZE = 100
+# Dispatch runs a notification may fail in before it is dropped
+MAX_SEND_ATTEMPTS = 3
+
+SMS_CHANNELS = ("SMS", "SMS Email")
+SMS_SENDER_NAME = "ConectaIoT"
+SMS_HEADER = "[SMS ConectaIoT]:"
+SMS_FOOTER = """--
+Sistema de Monitoreo de Alarmas Automaticas de ConectaIoT
+Para desactivar alertas, contacte al Administrador"""
+
+def queue_notification(channel: str, recipient: str, subject: str, message: str,
+                       summary: Optional[str] = None) -> None:
+  """Append a notification to the outbox without sending it.
+
+  `summary` is the one-line text used when several notifications for the same
+  recipient are merged; the full `message` is sent when there is only one.
+  If the outbox cannot be reached the notification is sent right away.
+  """
+  entry = {
+    'channel': channel,
+    'recipient': recipient,
+    'subject': subject,
+    'message': message,
+    'summary': summary or subject,
+    'queued_at': time.time()
+  }
+  try:
+    frappe.cache().rpush(OUTBOX_KEY, json.dumps(entry))
+  except Exception as e:
+    logger.error(f"Error queuing notification, sending it now: {str(e)}")
+    _send_batch(channel, [recipient], subject, message)
+
+def _drain() -> List[Dict]:
+  """Take every queued notification atomically"""
+  cache = frappe.cache()
+  key = cache.make_key(OUTBOX_KEY)
+  pipeline = cache.pipeline()
+  pipeline.lrange(key, 0, -1)
+  pipeline.delete(key)
+  raw_entries, _deleted = pipeline.execute()
+  entries = []
+  for raw in raw_entries:
+    try:
+      entries.append(json.loads(raw))
+    except ValueError:
+      logger.error(f"Dropping unreadable notification {raw!r}")
+  return entries
+
+def _requeue(entries: List[Dict]) -> None:
+  """Put notifications back at the head of the outbox, keeping their order"""
+  if not entries:
+    return
+  cache = frappe.cache()
+  cache.pipeline().lpush(cache.make_key(OUTBOX_KEY), *[json.dumps(entry) for entry in reversed(entries)]).execute()
+
+def _merge(entries: List[Dict]) -> Tuple[str, str]:
+  """Subject and message of one or several notifications for the same recipient"""
+  if len(entries) == 1:
+    return entries[0]['subject'], entries[0]['message']
+
+  subject = _("{0} alertas ConectaIoT").format(len(entries))
+  if entries[0]['channel'] == "Email":
+    items = "".join(f"<li><b>{entry['subject']}</b><br>{entry['summary']}</li>" for entry in entries)
+    return subject, f"<ul>{items}</ul>"
+  lines = "\n".join(entry['summary'] for entry in entries)
+  return subject, f"{SMS_HEADER}\n{lines}\n{SMS_FOOTER}"
+
+def _send_batch(channel: str, recipients: List[str], subject: str, message: str) -> List[str]:
+  """Send one message to many recipients.
+
+  Email goes to addresses, SMS through the SMS gateway, and SMS Email as SMS
+  text emailed to mobile numbers. Returns the recipients that were accepted:
+  the numbers the SMS gateway answered with success, or every recipient once
+  the email is queued. SMS batches are recorded in CN SMS Log.
+  """
+  sent = []
+  try:
+    if channel == "SMS":
+      sent = _send_sms(recipients, message)
+    elif channel == "SMS Email":
+      frappe.sendmail(recipients=recipients, subject='SMS Alert', message=message)
+      sent = recipients
+    else:
+      frappe.sendmail(
+        recipients=recipients,
+        subject=subject,
+        message=message,
+        header=[_('Información de Alertas ConectaIoT'), 'blue'],
+        retry=3
+      )
+      sent = recipients
+  except Exception as e:
+    logger.error(f"Error sending {channel} notification to {len(recipients)} recipients: {str(e)}")
+    frappe.log_error(message=frappe.get_traceback(), title="Notification Dispatch Error")
+
+  if channel in SMS_CHANNELS:
+    _log_sms(recipients, sent, message)
+  return sent
+
+def _send_sms(recipients: List[str], message: str) -> List[str]:
+  """Send an SMS to each number through the SMS Settings gateway.
+
+  Unlike frappe's send_sms, returns the numbers the gateway accepted.
+  """
+  settings = frappe.get_doc("SMS Settings")
+  if not settings.sms_gateway_url:
+    frappe.throw(_("Please Update SMS Settings"))
+  headers = get_headers(settings)
+  use_json = headers.get("Content-Type") == "application/json"
+  params = {row.parameter: row.value for row in settings.get("parameters") if not row.header}
+  params[settings.message_parameter] = frappe.safe_decode(message)
+
+  sent = []
+  for number in recipients:
+    try:
+      # Sent to the cleaned number, reported under the one it was queued for
+      receiver = validate_receiver_nos([number])[0]
+      status = send_request(
+        settings.sms_gateway_url,
+        dict(params, **{settings.receiver_parameter: receiver}),
+        headers,
+        settings.use_post,
+        use_json
+      )
+    except Exception as e:
+      logger.error(f"Error sending SMS to {number}: {str(e)}")
+      continue
+    if 200 <= status < 300:
+      sent.append(number)
+  return sent
+
+def _log_sms(requested: List[str], sent: List[str], message: str) -> None:
+  try:
+    frappe.get_doc({
+      'doctype': 'CN SMS Log',
+      'sender_name': SMS_SENDER_NAME,
+      'sent_on': nowdate(),
+      'message': message,
+      'no_of_requested_sms': len(requested),
+      'requested_numbers': "\n".join(requested),
+      'no_of_sent_sms': len(sent),
+      'sent_to': "\n".join(sent)
+    }).insert(ignore_permissions=True)
+  except Exception as e:
+    logger.error(f"Error recording CN SMS Log: {str(e)}")
+
+def _dispatch_settings() -> Dict:
+  """Per-minute limits of each channel (0 for no limit) and the digest interval in seconds"""
+  settings = frappe.get_single('CN Connect Settings')
+  email_limit = int(settings.email_rate_limit or 0)
+  sms_limit = int(settings.sms_rate_limit or 0)
+  digest = int(settings.digest_interval or 0) * 60 if settings.notification_digest else 0
+  return {
+    'limits': {"Email": email_limit, "SMS": sms_limit, "SMS Email": sms_limit},
+    'digest_seconds': digest
+  }
+
+def dispatch_notifications() -> None:
+  """Send the queued notifications, merged per channel and recipient.
+
+  Runs every minute. Notifications of a recipient queued since the last run are
+  sent as one message, or once per digest interval in digest mode. Recipients
+  over their channel's rate limit are held back, oldest first, until the next
+  run. Recipients with the same message share one gateway call. Notifications
+  the gateway did not accept are retried on later runs, up to
+  MAX_SEND_ATTEMPTS times.
+  """
+  try:
+    entries = _drain()
+  except Exception as e:
+    logger.error(f"Error draining notification outbox: {str(e)}")
+    return
+  if not entries:
+    return
+
+  groups: Dict[Tuple[str, str], List[Dict]] = {}
+  for entry in entries:
+    groups.setdefault((entry['channel'], entry['recipient']), []).append(entry)
+
+  settings = _dispatch_settings()
+  limits = settings['limits']
+  digest_before = time.time() - settings['digest_seconds']
+  counts: Dict[str, int] = {}
+  held = []
+  batches: Dict[Tuple[str, str, str], List[str]] = {}
+  for (channel, recipient), group in sorted(groups.items(), key=lambda item: item[1][0]['queued_at']):
+    if settings['digest_seconds'] and group[0]['queued_at'] > digest_before:
+      held.extend(group)
+      continue
+
+    limit = limits.get(channel, 0)
+    # The two SMS channels share the SMS limit
+    counter = "SMS" if channel in SMS_CHANNELS else channel
+    if limit and counts.get(counter, 0) >= limit:
+      held.extend(group)
+      continue
+    counts[counter] = counts.get(counter, 0) + 1
+
+    subject, message = _merge(group)
+    batches.setdefault((channel, subject, message), []).append(recipient)
+
+  dropped = 0
+  for (channel, subject, message), recipients in batches.items():
+    for offset in range(0, len(recipients), RECIPIENT_BATCH_SIZE):
+      batch = recipients[offset:offset + RECIPIENT_BATCH_SIZE]
+      sent = set(_send_batch(channel, batch, subject, message))
+      for recipient in batch:
+        if recipient in sent:
+          continue
+        for entry in groups[(channel, recipient)]:
+          entry['attempts'] = entry.get('attempts', 0) + 1
+          if entry['attempts'] < MAX_SEND_ATTEMPTS:
+            held.append(entry)
+          else:
+            dropped += 1
+  if dropped:
+    logger.error(f"Dropped {dropped} notifications after {MAX_SEND_ATTEMPTS} failed attempts")
+
+  frappe.db.commit()
+  if held:
+    held.sort(key=lambda entry: entry['queued_at'])
+    try:
+      _requeue(held)
+    except Exception as e:
+      logger.error(f"Error requeuing {len(held)} notifications: {str(e)}")
+    logger.info(f"Held back {len(held)} notifications for digests, rate limits or retries")
@@ -0,0 +1,84 @@
+import frappe
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Redis hash of device -> {'next_poll', 'interval', 'spacing', 'misses', 'polled_at'}
+SCHEDULE_KEY = "pibiconnect:poll_schedule"
+
+# Interval of the collection cron and the bounds of a device's poll interval
+TICK_SECONDS = 120
+MAX_INTERVAL_SECONDS = 1800
+# A device due within this margin of the tick is polled in it
+DUE_SLACK_SECONDS = 15
+# Weight of the latest observation in the smoothed reporting spacing
+SPACING_WEIGHT = 0.5
+
+class PollSchedule:
+  """Per-device poll cadence kept between cycles.
+
+  A device reporting points every N seconds is polled about every N seconds,
+  never more often than the collection tick nor less often than
+  MAX_INTERVAL_SECONDS. Devices returning no points are backed off
+  exponentially, and devices with an active alert are polled every tick.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._entries: Dict[str, Dict] = {}
+    self._changed: Dict[str, Dict] = {}
+
+  def load(self) -> None:
+    try:
+      self._entries = frappe.cache().hgetall(SCHEDULE_KEY) or {}
+    except Exception as e:
+      logger.error(f"Error loading poll schedule: {str(e)}")
+      self._entries = {}
+    self._changed = {}
+
+  def is_due(self, device_name: str, alerting: bool = False, now: Optional[float] = None) -> bool:
+    if alerting:
+      return True
+    entry = self._entries.get(device_name)
+    if not entry:
+      return True
+    now = now if now is not None else time.time()
+    return entry.get('next_poll', 0) <= now + DUE_SLACK_SECONDS
+
+  def observe(self, device_name: str, points: int, alerting: bool = False, now: Optional[float] = None) -> None:
+    """Schedule the next poll of a device from the points of its busiest series"""
+    now = now if now is not None else time.time()
+    entry = dict(self._entries.get(device_name) or {})
+    elapsed = now - entry['polled_at'] if entry.get('polled_at') else TICK_SECONDS
+
+    if points:
+      spacing = elapsed / points
+      if entry.get('spacing'):
+        spacing = SPACING_WEIGHT * spacing + (1 - SPACING_WEIGHT) * entry['spacing']
+      entry['spacing'] = spacing
+      entry['misses'] = 0
+      interval = spacing
+    else:
+      entry['misses'] = entry.get('misses', 0) + 1
+      interval = TICK_SECONDS * 2 ** entry['misses']
+
+    if alerting:
+      interval = TICK_SECONDS
+    entry['interval'] = int(min(max(interval, TICK_SECONDS), MAX_INTERVAL_SECONDS))
+    entry['polled_at'] = now
+    entry['next_poll'] = now + entry['interval']
+
+    with self._lock:
+      self._entries[device_name] = entry
+      self._changed[device_name] = entry
+
+  def save(self) -> None:
+    with self._lock:
+      changed, self._changed = self._changed, {}
+    try:
+      for device_name, entry in changed.items():
+        frappe.cache().hset(SCHEDULE_KEY, device_name, entry)
+    except Exception as e:
+      logger.error(f"Error saving poll schedule: {str(e)}")
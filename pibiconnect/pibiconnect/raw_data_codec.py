@@ -0,0 +1,106 @@
+import base64
+import json
+import struct
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pytz
+from frappe.utils import get_system_timezone
+from pibiconnect.pibiconnect.flux_stream import parse_value
+from pibiconnect.pibiconnect.series_cursor import from_epoch_us, to_epoch_us
+
+# CN Log Item.raw_data is a JSON column, so the compressed payload is wrapped in
+# a small JSON object: {"codec": CODEC, "data": "<base64>"}.
+CODEC = "delta-f64-zlib/1"
+LEGACY_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Payload header: flags and number of points
+HEADER = struct.Struct('<BI')
+FLAG_RAW_VALUES = 1
+
+def encode_raw_data(times: np.ndarray, values: np.ndarray, raw_values: Optional[np.ndarray] = None) -> str:
+  """Encode a window of points for CN Log Item.raw_data.
+
+  Timestamps are UTC epoch microseconds stored as deltas, so regular sampling
+  compresses to almost nothing; values are kept as float64.
+  """
+  times = np.asarray(times, dtype=np.int64)
+  flags = FLAG_RAW_VALUES if raw_values is not None else 0
+  parts = [
+    HEADER.pack(flags, times.size),
+    np.diff(times, prepend=np.int64(0)).astype('<i8').tobytes(),
+    np.asarray(values, dtype='<f8').tobytes()
+  ]
+  if raw_values is not None:
+    parts.append(np.asarray(raw_values, dtype='<f8').tobytes())
+  payload = base64.b64encode(zlib.compress(b''.join(parts))).decode('ascii')
+  return json.dumps({'codec': CODEC, 'data': payload}, separators=(',', ':'))
+
+def is_encoded(raw_data: Union[str, Dict, List, None]) -> bool:
+  """Whether a raw_data value already uses the compact encoding"""
+  if isinstance(raw_data, str):
+    try:
+      raw_data = json.loads(raw_data)
+    except ValueError:
+      return False
+  return isinstance(raw_data, dict) and raw_data.get('codec') == CODEC
+
+def decode_raw_data(raw_data: Union[str, Dict, List, None], timezone: Optional[str] = None) -> Dict[str, Optional[np.ndarray]]:
+  """Arrays of a raw_data value, either compact or in the legacy JSON row format.
+
+  Returns `times` (UTC epoch microseconds), `values` and `raw_values` (None when
+  no span was applied). Legacy timestamps are read in `timezone`, the system
+  timezone by default.
+  """
+  empty = {'times': np.empty(0, dtype=np.int64), 'values': np.empty(0), 'raw_values': None}
+  if not raw_data:
+    return empty
+  if isinstance(raw_data, str):
+    raw_data = json.loads(raw_data)
+
+  if isinstance(raw_data, dict):
+    if raw_data.get('codec') != CODEC:
+      raise ValueError(f"Unknown raw_data codec: {raw_data.get('codec')}")
+    payload = zlib.decompress(base64.b64decode(raw_data['data']))
+    flags, count = HEADER.unpack_from(payload)
+    offset = HEADER.size
+    times = np.cumsum(np.frombuffer(payload, dtype='<i8', count=count, offset=offset)).astype(np.int64)
+    offset += 8 * count
+    values = np.frombuffer(payload, dtype='<f8', count=count, offset=offset).astype(np.float64)
+    offset += 8 * count
+    raw_values = None
+    if flags & FLAG_RAW_VALUES:
+      raw_values = np.frombuffer(payload, dtype='<f8', count=count, offset=offset).astype(np.float64)
+    return {'times': times, 'values': values, 'raw_values': raw_values}
+
+  if not raw_data:
+    return empty
+  tz = pytz.timezone(timezone or get_system_timezone())
+  times = np.array([
+    to_epoch_us(tz.localize(datetime.strptime(row['timestamp'], LEGACY_TIMESTAMP_FORMAT)))
+    for row in raw_data
+  ], dtype=np.int64)
+  values = np.array([parse_value(str(row.get('value'))) for row in raw_data], dtype=np.float64)
+  raw_values = None
+  if any(row.get('raw_value') is not None for row in raw_data):
+    raw_values = np.array([
+      parse_value(str(row.get('raw_value'))) for row in raw_data
+    ], dtype=np.float64)
+  return {'times': times, 'values': values, 'raw_values': raw_values}
+
+def raw_data_rows(raw_data: Union[str, Dict, List, None], timezone: Optional[str] = None) -> List[Dict]:
+  """raw_data as the legacy list of {timestamp, value, raw_value} rows in system time"""
+  decoded = decode_raw_data(raw_data, timezone)
+  tz = pytz.timezone(timezone or get_system_timezone())
+  raw_values = decoded['raw_values']
+  raw_list = raw_values.tolist() if raw_values is not None else [None] * decoded['values'].size
+  return [
+    {
+      'timestamp': from_epoch_us(time_us).astimezone(tz).strftime(LEGACY_TIMESTAMP_FORMAT),
+      'value': str(value),
+      'raw_value': str(raw_value) if raw_value is not None else None
+    }
+    for time_us, value, raw_value in zip(decoded['times'].tolist(), decoded['values'].tolist(), raw_list, strict=True)
+  ]
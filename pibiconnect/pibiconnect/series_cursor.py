@@ -0,0 +1,135 @@
+import frappe
+import json
+import logging
+import pytz
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from frappe.utils import get_datetime
+from pibiconnect.pibiconnect.flux_stream import SeriesArrays
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+def to_epoch_us(dt: datetime) -> int:
+  """Exact epoch microseconds of a timezone-aware datetime"""
+  return (dt - EPOCH) // ONE_MICROSECOND
+
+def from_epoch_us(value: int) -> datetime:
+  """UTC datetime for epoch microseconds"""
+  return EPOCH + timedelta(microseconds=value)
+
+class SeriesCursor:
+  """Watermark of the last point ingested for a (device, sensor_var) series"""
+  def __init__(self, device: str, sensor_var: str, watermark: Optional[int] = None,
+               recent: Iterable[int] = (), name: Optional[str] = None):
+    self.device = device
+    self.sensor_var = sensor_var
+    self.watermark = watermark
+    self.recent = set(recent)
+    self.name = name
+
+  def start_time(self, lateness_us: int) -> Optional[datetime]:
+    """UTC start of the next fetch window, or None when nothing was ingested yet"""
+    if self.watermark is None:
+      return None
+    return from_epoch_us(self.watermark - lateness_us)
+
+  def is_new(self, timestamp_us: int, lateness_us: int) -> bool:
+    """Whether a point has not been ingested yet and is not too late to be accepted"""
+    if self.watermark is None or timestamp_us > self.watermark:
+      return True
+    # A cursor seeded from last_recorded does not know which late points were
+    # ingested, so everything up to its watermark counts as seen
+    if not self.recent:
+      return False
+    return timestamp_us > self.watermark - lateness_us and timestamp_us not in self.recent
+
+  def advance(self, timestamps_us: Iterable[int], lateness_us: int) -> None:
+    """Record ingested points and move the watermark forward"""
+    timestamps_us = list(timestamps_us)
+    if not timestamps_us:
+      return
+    latest = max(timestamps_us)
+    if self.watermark is None or latest > self.watermark:
+      self.watermark = latest
+    floor = self.watermark - lateness_us
+    self.recent = {ts for ts in self.recent.union(timestamps_us) if ts > floor} if lateness_us else set()
+
+class SeriesCursorStore:
+  """Per-series cursors kept in CN Series Cursor.
+
+  Cursors are loaded once per cycle. Each series belongs to a single device, so
+  worker threads never touch the same cursor. With a writer, cursor changes are
+  flushed together with the rest of the cycle's writes.
+  """
+  def __init__(self, tz_handler, lateness_seconds: int = 0, writer=None):
+    self.tz = tz_handler
+    self.writer = writer
+    self.lateness_us = max(int(lateness_seconds or 0), 0) * 1000000
+    self._cursors: Dict[Tuple[str, str], SeriesCursor] = {}
+
+  def load(self) -> None:
+    """Load every stored cursor"""
+    self._cursors = {}
+    rows = frappe.get_all(
+      'CN Series Cursor',
+      fields=['name', 'device', 'sensor_var', 'watermark', 'recent_points']
+    )
+    for row in rows:
+      try:
+        recent = json.loads(row.recent_points) if row.recent_points else []
+        watermark = int(row.watermark) if row.watermark else None
+      except (ValueError, TypeError):
+        # Keep the row so it is overwritten; the watermark is reseeded in get()
+        logger.error(f"Reseeding unreadable cursor {row.name}")
+        recent, watermark = [], None
+      self._cursors[(row.device, row.sensor_var.lower())] = SeriesCursor(
+        row.device, row.sensor_var, watermark, recent, row.name
+      )
+
+  def get(self, device: str, data_item) -> SeriesCursor:
+    """Cursor of a data item, seeded from its last_recorded when it has no watermark"""
+    key = (device, data_item.sensor_var.lower())
+    cursor = self._cursors.get(key)
+    if cursor is None:
+      cursor = self._cursors[key] = SeriesCursor(device, data_item.sensor_var)
+    if cursor.watermark is None and data_item.last_recorded:
+      cursor.watermark = to_epoch_us(self.tz.system_to_utc(get_datetime(data_item.last_recorded)))
+    return cursor
+
+  def filter_new(self, cursor: SeriesCursor, series: SeriesArrays) -> SeriesArrays:
+    """Drop points that were already ingested or fall outside the lateness window"""
+    if cursor.watermark is None or not len(series) or series.times[0] > cursor.watermark:
+      return series
+    return series.select(cursor.is_new(time_us, self.lateness_us) for time_us in series.times)
+
+  def advance(self, cursor: SeriesCursor, timestamps_us: Iterable[int]) -> None:
+    """Move a cursor past the given epoch microsecond timestamps and persist it"""
+    cursor.advance(timestamps_us, self.lateness_us)
+    self.save(cursor)
+
+  def save(self, cursor: SeriesCursor) -> None:
+    """Persist a cursor through the writer, or in the current transaction"""
+    if cursor.watermark is None:
+      return
+    values = {
+      'watermark': str(cursor.watermark),
+      'last_time': self.tz.format_for_frappe(from_epoch_us(cursor.watermark)),
+      'recent_points': json.dumps(sorted(cursor.recent))
+    }
+    if self.writer is not None:
+      if cursor.name:
+        self.writer.update('CN Series Cursor', cursor.name, values)
+      else:
+        # Name given by the doctype's format:{device}-{sensor_var} autoname
+        cursor.name = f"{cursor.device}-{cursor.sensor_var}"
+        self.writer.insert('CN Series Cursor', cursor.name, dict(values, device=cursor.device, sensor_var=cursor.sensor_var))
+      return
+    if cursor.name:
+      frappe.db.set_value('CN Series Cursor', cursor.name, values, update_modified=False)
+      return
+    doc = frappe.get_doc(dict(values, doctype='CN Series Cursor', device=cursor.device, sensor_var=cursor.sensor_var))
+    doc.insert(ignore_permissions=True)
+    cursor.name = doc.name
@@ -0,0 +1,80 @@
+import frappe
+import logging
+import socket
+import threading
+import zlib
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY_PREFIX = "pibiconnect:collect_lease:"
+# A lease not renewed for this long is free for the next tick to take over
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+
+def shard_of(device_name: str, shard_count: int) -> int:
+  """Stable shard of a device, the same on every worker"""
+  if shard_count <= 1:
+    return 0
+  return zlib.crc32(device_name.encode('utf-8')) % shard_count
+
+class ShardLease:
+  """Exclusive, expiring Redis lock on one shard of the fleet.
+
+  While held, a heartbeat thread renews the lease. If the worker dies, the
+  lease expires after LEASE_SECONDS and the next tick's job for the shard takes
+  it over; a holder that fails to renew marks the lease as lost so it can stop
+  before a new holder starts on the same devices.
+  """
+  def __init__(self, shard: int, lease_seconds: int = LEASE_SECONDS, heartbeat_seconds: int = HEARTBEAT_SECONDS):
+    self.shard = shard
+    self.lease_seconds = lease_seconds
+    self.heartbeat_seconds = heartbeat_seconds
+    cache = frappe.cache()
+    self._lock = cache.lock(
+      cache.make_key(f"{LEASE_KEY_PREFIX}{shard}"),
+      timeout=lease_seconds,
+      thread_local=False
+    )
+    self._stop = threading.Event()
+    self._heartbeat: Optional[threading.Thread] = None
+    self.lost = False
+
+  @property
+  def holder(self) -> str:
+    return f"{socket.gethostname()}:{threading.get_ident()}"
+
+  def acquire(self) -> bool:
+    """Take the lease without waiting; False when another worker holds it"""
+    if not self._lock.acquire(blocking=False):
+      return False
+    self._stop.clear()
+    self.lost = False
+    self._heartbeat = threading.Thread(
+      target=self._renew,
+      name=f"pibiconnect-lease-{self.shard}",
+      daemon=True
+    )
+    self._heartbeat.start()
+    logger.info(f"Shard {self.shard} leased by {self.holder}")
+    return True
+
+  def _renew(self) -> None:
+    while not self._stop.wait(self.heartbeat_seconds):
+      try:
+        self._lock.extend(self.lease_seconds, replace_ttl=True)
+      except Exception as e:
+        self.lost = True
+        logger.error(f"Lost lease of shard {self.shard}: {str(e)}")
+        return
+
+  def release(self) -> None:
+    self._stop.set()
+    if self._heartbeat is not None:
+      self._heartbeat.join()
+      self._heartbeat = None
+    try:
+      self._lock.release()
+    except Exception as e:
+      # Expired and possibly taken over already
+      logger.error(f"Error releasing lease of shard {self.shard}: {str(e)}")
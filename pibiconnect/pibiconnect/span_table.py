@@ -0,0 +1,147 @@
+import frappe
+from frappe import _
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Offset subtracted from the input signal before scaling
+CALIBRATION_FACTOR = 0.00
+
+# Input signal range of each CN Span scale, 0-10 V when the scale is not set
+SCALE_RANGES = {
+  '0-10V': (0.0, 10.0),
+  '4-20mA': (4.0, 20.0)
+}
+DEFAULT_SCALE = '0-10V'
+
+def parse_coefficients(coefficients: Optional[str]) -> List[float]:
+  """Polynomial coefficients of a CN Span, lowest degree first"""
+  if not coefficients:
+    return []
+  try:
+    return [float(value) for value in coefficients.replace(';', ',').split(',') if value.strip()]
+  except ValueError:
+    frappe.throw(_("Coefficients must be numbers separated by commas"))
+
+class CompiledSpan:
+  """Calibration curve of one CN Span, applied to whole arrays of readings.
+
+  Linear spans map the input range of their scale onto lower/higher span,
+  piecewise spans interpolate between calibration points and polynomial spans
+  evaluate their coefficients over the input signal.
+  """
+  __slots__ = ('curve_type', 'input_min', 'lower_span', 'higher_span', 'span_factor', 'xp', 'fp', 'poly')
+
+  def __init__(self, lower_span: float = 0.0, higher_span: float = 0.0, span_factor: float = 0.0,
+               scale: Optional[str] = None, curve_type: Optional[str] = None,
+               points: Iterable[Tuple[float, float]] = (), coefficients: Iterable[float] = ()):
+    self.curve_type = curve_type or 'Linear'
+    self.input_min = SCALE_RANGES.get(scale or DEFAULT_SCALE, SCALE_RANGES[DEFAULT_SCALE])[0]
+    self.lower_span = lower_span or 0.0
+    self.higher_span = higher_span or 0.0
+    self.span_factor = span_factor or 0.0
+    points = sorted(points)
+    self.xp = np.array([point[0] for point in points], dtype=np.float64)
+    self.fp = np.array([point[1] for point in points], dtype=np.float64)
+    # np.polyval expects the highest degree first
+    self.poly = np.array(list(coefficients)[::-1], dtype=np.float64)
+
+  @classmethod
+  def from_doc(cls, doc) -> 'CompiledSpan':
+    return cls(
+      doc.lower_span, doc.higher_span, doc.span_factor, doc.scale, doc.curve_type,
+      [(point.input_value, point.output_value) for point in doc.get('calibration_points') or []],
+      parse_coefficients(doc.coefficients)
+    )
+
+  @property
+  def active(self) -> bool:
+    """Whether the span transforms readings at all"""
+    if self.curve_type == 'Piecewise':
+      return self.xp.size >= 2
+    if self.curve_type == 'Polynomial':
+      return self.poly.size > 0
+    return bool(self.higher_span or self.lower_span)
+
+  def apply(self, values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    if not self.active:
+      return values
+    if self.curve_type == 'Piecewise':
+      # Readings beyond the first and last points are held at their ends
+      return np.interp(values, self.xp, self.fp)
+    if self.curve_type == 'Polynomial':
+      return np.polyval(self.poly, values)
+    # Clip at the bottom of the input range to avoid readings below the lower span
+    adjusted = np.maximum(values - CALIBRATION_FACTOR, self.input_min) - self.input_min
+    return self.lower_span + adjusted * self.span_factor
+
+  def as_dict(self) -> Dict:
+    """Parameters of the curve for clients that apply it to live readings"""
+    return {
+      'curve_type': self.curve_type,
+      'calibration_factor': CALIBRATION_FACTOR,
+      'input_min': self.input_min,
+      'lower_span': self.lower_span,
+      'span_factor': self.span_factor,
+      'xp': self.xp.tolist(),
+      'fp': self.fp.tolist(),
+      'poly': self.poly.tolist()
+    }
+
+class SpanTable:
+  """Every CN Span of the site keyed by (device, sensor_var), loaded once per cycle"""
+  def __init__(self):
+    self._spans: Dict[Tuple[str, str], CompiledSpan] = {}
+    self._by_device: Dict[str, Set[str]] = {}
+
+  def load(self, device: Optional[str] = None) -> None:
+    """Load the spans of every device, or only those of `device`"""
+    self._spans = {}
+    self._by_device = {}
+    rows = frappe.get_all(
+      'CN Span',
+      filters={'device': device} if device else None,
+      fields=['name', 'device', 'sensor_var', 'scale', 'curve_type', 'lower_span',
+              'higher_span', 'span_factor', 'coefficients']
+    )
+    point_filters = {'parenttype': 'CN Span', 'parentfield': 'calibration_points'}
+    if device:
+      point_filters['parent'] = ['in', [row.name for row in rows] or ['']]
+    points: Dict[str, List[Tuple[float, float]]] = {}
+    for point in frappe.get_all(
+      'CN Span Point',
+      filters=point_filters,
+      fields=['parent', 'input_value', 'output_value'],
+      parent_doctype='CN Span'
+    ):
+      points.setdefault(point.parent, []).append((point.input_value or 0.0, point.output_value or 0.0))
+
+    for row in rows:
+      if not row.device or not row.sensor_var:
+        continue
+      try:
+        coefficients = parse_coefficients(row.coefficients)
+      except frappe.ValidationError:
+        coefficients = []
+      sensor_var = row.sensor_var.lower()
+      self._spans[(row.device, sensor_var)] = CompiledSpan(
+        row.lower_span, row.higher_span, row.span_factor, row.scale, row.curve_type,
+        points.get(row.name, []), coefficients
+      )
+      self._by_device.setdefault(row.device, set()).add(sensor_var)
+
+  def get(self, device: str, sensor_var: str) -> Optional[CompiledSpan]:
+    return self._spans.get((device, sensor_var.lower()))
+
+  def sensor_vars(self, device: str) -> Set[str]:
+    """Lowercase sensor vars of a device that have a CN Span"""
+    return self._by_device.get(device, set())
+
+  def curves(self, device: str) -> Dict[str, Dict]:
+    """Active span curves of a device keyed by lowercase sensor var"""
+    return {
+      sensor_var: self._spans[(device, sensor_var)].as_dict()
+      for sensor_var in sorted(self.sensor_vars(device))
+      if self._spans[(device, sensor_var)].active
+    }
@@ -0,0 +1,101 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import frappe
+import numpy as np
+import pytz
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.aggregators import (
+  AGGREGATORS, PUSHDOWN_AGGREGATORS, _python_window_statistics, get_aggregator, recency_weighted,
+  window_statistics
+)
+from pibiconnect.pibiconnect.collect_influx_data import DeviceManager
+from pibiconnect.pibiconnect.flux_stream import SeriesArrays
+from pibiconnect.pibiconnect.series_cursor import from_epoch_us
+
+# Irregular sampling starting 2026-01-01 00:00:00 UTC
+START_US = 1767225600000000
+TIMES = START_US + np.array([0, 7, 10, 31, 45, 46, 90], dtype=np.int64) * 1000000
+VALUES = np.array([20.0, 21.5, 19.0, 25.0, 24.5, 30.0, 22.0])
+
+def pushdown_stats(times: np.ndarray, values: np.ndarray, range_start_us: int) -> dict:
+  """The row the pushdown reduce() in fetch_window_stats returns for a series"""
+  t = (times - range_start_us) / 1e6
+  return {
+    'count': int(values.size),
+    'sum': float(values.sum()),
+    'sum_t': float(t.sum()),
+    'sum_vt': float(np.dot(values, t)),
+    'min': float(values.min()),
+    'max': float(values.max()),
+    'first_t': float(t.min()),
+    'last_t': float(t.max()),
+    'last_time': from_epoch_us(int(times.max())).astimezone(pytz.UTC)
+  }
+
+class TestAggregators(FrappeTestCase):
+  def test_recency_weighted_matches_list_reference(self):
+    reference = _python_window_statistics(TIMES.tolist(), VALUES.tolist())
+    statistics = window_statistics(TIMES, VALUES)
+    for key in ('value', 'average', 'maximum', 'minimum'):
+      self.assertAlmostEqual(statistics[key], reference[key])
+
+  def test_recency_weighted_edge_cases(self):
+    self.assertEqual(recency_weighted(TIMES[:1], VALUES[:1]), 20.0)
+    # Points at the same time are weighted equally
+    same_time = np.full(3, START_US, dtype=np.int64)
+    self.assertAlmostEqual(recency_weighted(same_time, VALUES[:3]), VALUES[:3].mean())
+    # The first point carries no weight
+    self.assertAlmostEqual(recency_weighted(TIMES[:2], VALUES[:2]), 21.5)
+
+  def test_aggregators(self):
+    times = START_US + np.arange(4, dtype=np.int64) * 1000000
+    values = np.array([1.0, 3.0, 2.0, 6.0])
+    self.assertAlmostEqual(AGGREGATORS['Mean'](times, values), 3.0)
+    self.assertAlmostEqual(AGGREGATORS['Median'](times, values), 2.5)
+    self.assertAlmostEqual(AGGREGATORS['Time Weighted'](times, values), (4 + 5 + 8) / 6)
+    # Weights 1/8, 1/8, 1/4 and 1/2 with a smoothing factor of 0.5
+    self.assertAlmostEqual(AGGREGATORS['EWMA'](times, values, 0.5), 4.0)
+    self.assertAlmostEqual(AGGREGATORS['Percentile'](times, values, 50), 2.5)
+    self.assertAlmostEqual(AGGREGATORS['Standard Deviation'](times, values), float(np.std(values)))
+    self.assertIs(get_aggregator('Unknown'), recency_weighted)
+
+class TestPushdownMoments(FrappeTestCase):
+  def setUp(self):
+    fetcher = MagicMock()
+    fetcher.config.write_batch_size = 100
+    fetcher.config.lateness_window = 0
+    fetcher.config.field_catalog_ttl = 0
+    self.manager = DeviceManager(fetcher, MagicMock())
+    self.data_item = frappe._dict(sensor_var='temp')
+
+  def readings(self, times: np.ndarray, values: np.ndarray) -> SeriesArrays:
+    series = SeriesArrays()
+    for time_us, value in zip(times.tolist(), values.tolist(), strict=True):
+      series.append(time_us, value)
+    return series
+
+  def assertSameWindow(self, times: np.ndarray, values: np.ndarray, range_start_us: int):
+    for aggregator in PUSHDOWN_AGGREGATORS:
+      with self.subTest(aggregator=aggregator, points=values.size):
+        self.manager.sensor_vars = {'temp': {'aggregator': aggregator}}
+        in_memory = self.manager.window_from_readings('DEV-1', self.data_item, self.readings(times, values), False)
+        pushdown = self.manager.window_from_stats(pushdown_stats(times, values, range_start_us), aggregator)
+        for key in ('value', 'average', 'maximum', 'minimum', 'readings'):
+          self.assertAlmostEqual(pushdown[key], in_memory[key], places=6)
+
+  def test_pushdown_matches_in_memory(self):
+    # The query measures time from the start of its range, before the first point
+    self.assertSameWindow(TIMES, VALUES, START_US - 3600 * 1000000)
+    self.assertSameWindow(TIMES, VALUES, START_US)
+
+  def test_pushdown_edge_cases(self):
+    self.assertSameWindow(TIMES[:1], VALUES[:1], START_US - 1000000)
+    self.assertSameWindow(np.full(3, START_US, dtype=np.int64), VALUES[:3], START_US - 1000000)
+
+  def test_empty_pushdown_row(self):
+    self.assertIsNone(self.manager.window_from_stats(None))
+    self.assertIsNone(self.manager.window_from_stats({'count': 0}))
+    window = self.manager.window_from_stats(pushdown_stats(TIMES, VALUES, START_US))
+    self.assertEqual(window['timestamps'], [int(TIMES[-1])])
+    self.manager.tz.utc_to_system.assert_called_with(datetime(2026, 1, 1, 0, 1, 30, tzinfo=pytz.UTC))
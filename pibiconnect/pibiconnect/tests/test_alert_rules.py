@@ -0,0 +1,55 @@
+import numpy as np
+
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.alert_rules import AlertRuleTable
+
+def transitions(values, high, band=0.0, active=False, last_alert_us=-1, cooldown_us=0,
+                stable_us=0, pending_since_us=None):
+  """High alert transitions of readings taken every 10 us from time 0"""
+  values = np.asarray(values, dtype=np.float64)
+  times = np.arange(values.size, dtype=np.int64) * 10
+  return AlertRuleTable._transitions(
+    times, values >= high, values < high - band, active,
+    last_alert_us, cooldown_us, stable_us, pending_since_us
+  )
+
+class TestAlertTransitions(FrappeTestCase):
+  def test_crossings_at_exact_time(self):
+    events, pending = transitions([1, 5, 6, 2, 1], high=5)
+    self.assertEqual(events, [(1, 10, True), (3, 30, False)])
+    self.assertIsNone(pending)
+
+  def test_no_crossing(self):
+    self.assertEqual(transitions([1, 2, 3], high=5), ([], None))
+    # Already active and still above the threshold
+    self.assertEqual(transitions([6, 7], high=5, active=True), ([], None))
+
+  def test_hysteresis_band(self):
+    # 4.5 is below the threshold but within the band, so the alert stays on
+    events, _pending = transitions([1, 5, 4.5, 6, 3], high=5, band=1)
+    self.assertEqual(events, [(1, 10, True), (4, 40, False)])
+
+  def test_stability_span(self):
+    # The change is timed at the start of a run that lasted long enough
+    events, pending = transitions([5, 5, 5, 1], high=5, stable_us=20)
+    self.assertEqual(events, [(0, 0, True)])
+    # The finish run started at 30 and is still waiting for its span
+    self.assertEqual(pending, 30)
+
+    # A spike shorter than the span is ignored
+    self.assertEqual(transitions([1, 5, 1, 1], high=5, stable_us=20), ([], None))
+
+  def test_pending_change_from_previous_window(self):
+    events, pending = transitions([5, 5, 1], high=5, stable_us=20, pending_since_us=-10)
+    self.assertEqual(events, [(0, -10, True)])
+    self.assertEqual(pending, 20)
+
+    # A pending change broken at the first point is dropped
+    self.assertEqual(transitions([1, 1], high=5, stable_us=20, pending_since_us=-10), ([], None))
+
+  def test_cooldown_holds_back_the_event(self):
+    events, _pending = transitions([1, 5, 5, 5], high=5, last_alert_us=0, cooldown_us=25)
+    self.assertEqual(events, [(3, 30, True)])
+
+    # A run over before the cooldown ends raises nothing
+    self.assertEqual(transitions([1, 5, 1], high=5, last_alert_us=0, cooldown_us=25), ([], None))
@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock, patch
+
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.circuit_breaker import BREAKER_KEY, HostCircuitBreaker
+
+class TestHostCircuitBreaker(FrappeTestCase):
+  def setUp(self):
+    self.cache = MagicMock()
+    self.cache.hgetall.return_value = {}
+    self.now = 1000.0
+    for target, kwargs in (
+      ('frappe.cache', {'return_value': self.cache}),
+      ('frappe.log_error', {}),
+      ('pibiconnect.pibiconnect.circuit_breaker.time.time', {'side_effect': lambda: self.now}),
+    ):
+      patcher = patch(target, **kwargs)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_opens_after_threshold_strikes(self):
+    breaker = HostCircuitBreaker(threshold=3, cooloff_seconds=60)
+    error = TimeoutError('timed out')
+    breaker.record('pi-1', 1.0, error)
+    breaker.record('pi-1', 1.0, error)
+    self.assertFalse(breaker.is_open('pi-1'))
+
+    breaker.record('pi-1', 1.0, error)
+    self.assertTrue(breaker.is_open('pi-1'))
+    self.assertEqual(breaker.open_until('pi-1'), 1060.0)
+    self.assertFalse(breaker.is_open('pi-2'))
+    self.cache.hset.assert_called_with(
+      BREAKER_KEY, 'pi-1', {'failures': 3, 'reason': 'timed out', 'open_until': 1060.0}
+    )
+
+  def test_success_resets_strikes(self):
+    breaker = HostCircuitBreaker(threshold=2, cooloff_seconds=60)
+    breaker.record('pi-1', 1.0, TimeoutError('timed out'))
+    breaker.record('pi-1', 1.0)
+    self.cache.hdel.assert_called_once_with(BREAKER_KEY, 'pi-1')
+    self.assertIsNone(breaker.open_until('pi-1'))
+
+    breaker.record('pi-1', 1.0, TimeoutError('timed out'))
+    self.assertFalse(breaker.is_open('pi-1'))
+
+  def test_half_open_after_cooloff(self):
+    breaker = HostCircuitBreaker(threshold=1, cooloff_seconds=60)
+    breaker.record('pi-1', 1.0, TimeoutError('timed out'))
+    self.assertTrue(breaker.is_open('pi-1'))
+
+    self.now += 61
+    self.assertFalse(breaker.is_open('pi-1'))
+    # Another strike on the trial query reopens it for a full cooloff
+    breaker.record('pi-1', 1.0, TimeoutError('timed out'))
+    self.assertTrue(breaker.is_open('pi-1'))
+    self.assertEqual(breaker.open_until('pi-1'), self.now + 60)
+
+    self.now += 61
+    breaker.record('pi-1', 1.0)
+    self.assertIsNone(breaker.open_until('pi-1'))
+
+  def test_slow_queries_count_as_strikes(self):
+    breaker = HostCircuitBreaker(threshold=1, cooloff_seconds=60, slow_seconds=5)
+    breaker.record('pi-1', 4.9)
+    self.assertFalse(breaker.is_open('pi-1'))
+    breaker.record('pi-1', 5.0)
+    self.assertTrue(breaker.is_open('pi-1'))
+    self.assertEqual(self.cache.hset.call_args.args[2]['reason'], 'query took 5.0s')
+
+  def test_state_shared_through_redis(self):
+    self.cache.hgetall.return_value = {'pi-1': {'failures': 3, 'open_until': 1060.0}}
+    breaker = HostCircuitBreaker(threshold=3, cooloff_seconds=60)
+    self.assertTrue(breaker.is_open('pi-1'))
+
+    # An unreachable Redis leaves every circuit closed
+    self.cache.hgetall.side_effect = ConnectionError('down')
+    self.assertFalse(HostCircuitBreaker().is_open('pi-1'))
@@ -0,0 +1,35 @@
+from unittest.mock import MagicMock
+
+import frappe
+import numpy as np
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.collect_influx_data import DeviceManager
+from pibiconnect.pibiconnect.flux_stream import SeriesArrays
+from pibiconnect.pibiconnect.raw_data_codec import decode_raw_data
+
+class TestWindowFromReadings(FrappeTestCase):
+  def setUp(self):
+    fetcher = MagicMock()
+    fetcher.config.write_batch_size = 100
+    fetcher.config.lateness_window = 0
+    fetcher.config.field_catalog_ttl = 0
+    self.manager = DeviceManager(fetcher, MagicMock())
+    self.data_item = frappe._dict(sensor_var='temp')
+    self.readings = SeriesArrays()
+    for time_us, value in ((1000000, 20.0), (2000000, 21.0), (3000000, 22.0)):
+      self.readings.append(time_us, value)
+
+  def test_raw_data_kept(self):
+    window = self.manager.window_from_readings('DEV-1', self.data_item, self.readings, True)
+    self.assertEqual(window['readings'], 3)
+    decoded = decode_raw_data(window['raw_data'])
+    self.assertEqual(decoded['times'].tolist(), [1000000, 2000000, 3000000])
+    self.assertEqual(decoded['values'].tolist(), [20.0, 21.0, 22.0])
+
+  def test_raw_data_not_kept(self):
+    window = self.manager.window_from_readings('DEV-1', self.data_item, self.readings, False)
+    self.assertIsNone(window['raw_data'])
+    # Statistics are computed from the readings all the same
+    self.assertEqual(window['readings'], 3)
+    self.assertEqual(window['maximum'], 22.0)
+    self.assertTrue(np.array_equal(window['series'][1], [20.0, 21.0, 22.0]))
@@ -0,0 +1,82 @@
+import time
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.collection_queue import CARRYOVER_KEY, CollectionQueue
+
+SENSOR_TYPES = {'critical': {'critical': 1}}
+
+def device(name, sensor_type=None, *last_recorded):
+  return frappe._dict(
+    name=name, sensor_type=sensor_type,
+    data_item=[frappe._dict(last_recorded=value) for value in last_recorded]
+  )
+
+class TestCollectionQueue(FrappeTestCase):
+  def setUp(self):
+    patcher = patch(
+      'pibiconnect.pibiconnect.collection_queue.get_sensor_type',
+      side_effect=lambda name: SENSOR_TYPES.get(name, {})
+    )
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.devices = [
+      device('NEW', None, datetime(2026, 1, 2)),
+      device('OLD', None, datetime(2026, 1, 1), datetime(2026, 1, 3)),
+      device('NEVER', None, None),
+      device('CRIT', 'critical', datetime(2026, 1, 1)),
+      device('ALERT', None, datetime(2026, 1, 3)),
+    ]
+
+  def queue(self, carryover=None, budget_seconds=0):
+    with patch.object(CollectionQueue, '_load_carryover', return_value=carryover or {}):
+      return CollectionQueue(self.devices, lambda name: name == 'ALERT', budget_seconds)
+
+  def drain(self, queue):
+    names = []
+    while (device_doc := queue.pop()) is not None:
+      names.append(device_doc.name)
+    return names
+
+  def test_priority_order(self):
+    queue = self.queue()
+    self.assertEqual([d.name for d in queue.devices()], ['ALERT', 'CRIT', 'NEVER', 'OLD', 'NEW'])
+    self.assertEqual(self.drain(queue), ['ALERT', 'CRIT', 'NEVER', 'OLD', 'NEW'])
+    self.assertEqual(queue.processed, ['ALERT', 'CRIT', 'NEVER', 'OLD', 'NEW'])
+    self.assertEqual(len(queue), 0)
+
+  def test_carried_over_devices_move_up_a_class(self):
+    queue = self.queue({'NEW': 1})
+    self.assertEqual(self.drain(queue), ['ALERT', 'NEW', 'CRIT', 'NEVER', 'OLD'])
+
+    # Two runs behind puts a device with the alerting ones, ahead of them
+    queue = self.queue({'NEW': 2})
+    self.assertEqual(self.drain(queue), ['NEW', 'ALERT', 'CRIT', 'NEVER', 'OLD'])
+
+  def test_budget(self):
+    self.assertFalse(self.queue().expired)
+
+    queue = self.queue(budget_seconds=60)
+    self.assertFalse(queue.expired)
+    self.assertEqual(queue.pop().name, 'ALERT')
+
+    queue.deadline = time.monotonic() - 1
+    self.assertTrue(queue.expired)
+    self.assertIsNone(queue.pop())
+    self.assertEqual(queue.processed, ['ALERT'])
+    self.assertEqual(queue.remaining(), ['CRIT', 'NEVER', 'OLD', 'NEW'])
+
+  def test_save_carryover(self):
+    queue = self.queue({'ALERT': 1, 'OLD': 1}, budget_seconds=60)
+    queue.pop()
+    queue.deadline = time.monotonic() - 1
+
+    cache = MagicMock()
+    with patch('frappe.cache', return_value=cache):
+      queue.save_carryover()
+
+    cache.hdel.assert_called_once_with(CARRYOVER_KEY, 'ALERT')
+    stored = {call.args[1]: call.args[2] for call in cache.hset.call_args_list}
+    self.assertEqual(stored, {'OLD': 2, 'CRIT': 1, 'NEVER': 1, 'NEW': 1})
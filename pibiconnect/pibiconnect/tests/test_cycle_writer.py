@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.cycle_writer import CycleWriter
+
+class TestCycleWriter(FrappeTestCase):
+  def test_unit_joins_the_batch_when_done(self):
+    writer = CycleWriter()
+    writer.update('CN Device', 'DEV-1', {'connected': 1})
+    with writer.unit():
+      writer.update('CN Data Item', 'ITEM-1', {'value': '1'})
+      writer.insert('CN Series Cursor', 'CUR-1', {'watermark': '10'})
+      writer.update('CN Series Cursor', 'CUR-1', {'watermark': '20'})
+      # Nothing of the unit is visible to a flush yet
+      self.assertEqual(len(writer), 1)
+    self.assertEqual(len(writer), 3)
+    self.assertEqual(writer._batch.inserts[('CN Series Cursor', 'CUR-1')], {'watermark': '20'})
+
+  def test_unit_merges_into_pending_inserts(self):
+    writer = CycleWriter()
+    writer.insert('CN Series Cursor', 'CUR-1', {'watermark': '10'})
+    with writer.unit():
+      writer.update('CN Series Cursor', 'CUR-1', {'watermark': '20'})
+    self.assertEqual(writer._batch.updates, {})
+    self.assertEqual(writer._batch.inserts[('CN Series Cursor', 'CUR-1')], {'watermark': '20'})
+
+  def test_failed_unit_is_dropped(self):
+    writer = CycleWriter()
+    with self.assertRaises(RuntimeError):
+      with writer.unit():
+        writer.update('CN Data Item', 'ITEM-1', {'value': '1'})
+        raise RuntimeError('device failed')
+    self.assertEqual(len(writer), 0)
+
+    with writer.unit():
+      writer.update('CN Data Item', 'ITEM-1', {'value': '1'})
+      writer.discard()
+      writer.update('CN Device', 'DEV-1', {'connected': 0})
+    self.assertEqual(list(writer._batch.updates), [('CN Device', 'DEV-1')])
+
+  def test_flush_writes_and_commits_once(self):
+    writer = CycleWriter(batch_size=2)
+    writer.update('CN Data Item', 'ITEM-1', {'value': '1'})
+    with patch('frappe.db') as db:
+      writer.flush_if_full()
+      db.commit.assert_not_called()
+      writer.update('CN Data Item', 'ITEM-2', {'value': '2'})
+      writer.flush_if_full()
+    db.sql.assert_called_once()
+    db.commit.assert_called_once()
+    self.assertEqual(len(writer), 0)
@@ -0,0 +1,57 @@
+import math
+
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.flux_stream import SeriesArrays, parse_flux_csv, parse_time_us
+
+HEADER = ['', 'result', 'table', '_time', '_value', 'host', '_field']
+
+class TestFluxStream(FrappeTestCase):
+  def test_parse_time_us(self):
+    self.assertEqual(parse_time_us('1970-01-01T00:00:01Z'), 1000000)
+    self.assertEqual(parse_time_us('2026-01-01T00:00:00.5Z'), 1767225600500000)
+    # Nanosecond precision is truncated to microseconds
+    self.assertEqual(parse_time_us('2026-01-01T00:00:00.123456789Z'), 1767225600123456)
+
+  def test_rows_grouped_by_key_columns(self):
+    rows = [
+      HEADER,
+      ['', '_result', '0', '1970-01-01T00:00:02Z', '2.5', 'pi-1', 'temp'],
+      ['', '_result', '0', '1970-01-01T00:00:01Z', '1.5', 'pi-1', 'temp'],
+      ['', '_result', '1', '1970-01-01T00:00:01Z', '7', 'pi-2', 'temp'],
+    ]
+    series = parse_flux_csv(rows, ('host', '_field'))
+    self.assertEqual(set(series), {('pi-1', 'temp'), ('pi-2', 'temp')})
+    # Points are sorted by time within each series
+    self.assertEqual(list(series[('pi-1', 'temp')].times), [1000000, 2000000])
+    self.assertEqual(list(series[('pi-1', 'temp')].values), [1.5, 2.5])
+    self.assertEqual(list(series[('pi-2', 'temp')].values), [7.0])
+
+  def test_blank_row_starts_a_new_table(self):
+    rows = [
+      HEADER,
+      ['', '_result', '0', '1970-01-01T00:00:01Z', '1', 'pi-1', 'temp'],
+      [],
+      # The next table may order its columns differently
+      ['', 'result', 'table', '_field', 'host', '_value', '_time'],
+      ['', '_result', '1', 'hum', 'pi-1', 'wet', '1970-01-01T00:00:03Z'],
+    ]
+    series = parse_flux_csv(rows, ('_field',))
+    self.assertEqual(list(series[('temp',)].values), [1.0])
+    self.assertEqual(list(series[('hum',)].times), [3000000])
+    self.assertTrue(math.isnan(series[('hum',)].values[0]))
+
+  def test_error_table_raises(self):
+    with self.assertRaises(ValueError):
+      parse_flux_csv([['', 'error', 'reference'], ['', 'bad query', '']])
+
+  def test_empty_result(self):
+    self.assertEqual(parse_flux_csv([], ('host',)), {})
+    self.assertEqual(parse_flux_csv([HEADER], ('host',)), {})
+
+  def test_series_since_and_select(self):
+    series = SeriesArrays()
+    for time_us in (10, 20, 30):
+      series.append(time_us, time_us / 10)
+    self.assertIs(series.since(10), series)
+    self.assertEqual(list(series.since(15).times), [20, 30])
+    self.assertEqual(list(series.select([True, False, True]).values), [1.0, 3.0])
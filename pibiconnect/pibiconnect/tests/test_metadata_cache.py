@@ -0,0 +1,30 @@
+from unittest.mock import MagicMock, patch
+
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect import metadata_cache
+from pibiconnect.pibiconnect.metadata_cache import CACHE_KEY_PREFIX, LOADERS, on_metadata_change
+
+class TestMetadataCache(FrappeTestCase):
+  def setUp(self):
+    self.cache = MagicMock()
+    patcher = patch('frappe.cache', return_value=self.cache)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def assertInvalidated(self):
+    self.assertIsNone(metadata_cache._local.get(('site', 'sensor_var')))
+    self.assertEqual(
+      {call.args[0] for call in self.cache.delete_value.call_args_list},
+      {CACHE_KEY_PREFIX + kind for kind in LOADERS}
+    )
+
+  def test_invalidated_on_update(self):
+    metadata_cache._local.set(('site', 'sensor_var'), {'temp': {}})
+    on_metadata_change(MagicMock(), 'on_update')
+    self.assertInvalidated()
+
+  def test_invalidated_after_rename(self):
+    # Frappe passes the old and new names and the merge flag to after_rename
+    metadata_cache._local.set(('site', 'sensor_var'), {'temp': {}})
+    on_metadata_change(MagicMock(), 'after_rename', 'temp', 'temperature', False)
+    self.assertInvalidated()
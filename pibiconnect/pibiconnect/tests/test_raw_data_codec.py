@@ -0,0 +1,86 @@
+import json
+from unittest.mock import patch
+
+import frappe
+import numpy as np
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.patches.v1_0 import encode_log_item_raw_data
+from pibiconnect.pibiconnect.raw_data_codec import (
+  CODEC, decode_raw_data, encode_raw_data, is_encoded, raw_data_rows
+)
+
+# 2026-01-01 00:00:00 UTC
+START_US = 1767225600000000
+
+LEGACY = json.dumps([
+  {'timestamp': '2026-01-01 01:00:00', 'value': '20.5', 'raw_value': '4.1'},
+  {'timestamp': '2026-01-01 01:00:10', 'value': 'n/a', 'raw_value': '4.2'}
+])
+
+class TestRawDataCodec(FrappeTestCase):
+  def test_roundtrip(self):
+    times = np.array([START_US, START_US + 10000000, START_US + 20000123], dtype=np.int64)
+    values = np.array([1.5, -2.25, 1e9])
+    raw_data = encode_raw_data(times, values)
+    self.assertEqual(json.loads(raw_data)['codec'], CODEC)
+    self.assertTrue(is_encoded(raw_data))
+
+    decoded = decode_raw_data(raw_data)
+    self.assertEqual(decoded['times'].tolist(), times.tolist())
+    self.assertEqual(decoded['values'].tolist(), values.tolist())
+    self.assertIsNone(decoded['raw_values'])
+
+  def test_roundtrip_with_raw_values(self):
+    times = np.array([START_US, START_US + 10000000], dtype=np.int64)
+    decoded = decode_raw_data(encode_raw_data(times, [10.0, 20.0], [4.0, 5.0]))
+    self.assertEqual(decoded['values'].tolist(), [10.0, 20.0])
+    self.assertEqual(decoded['raw_values'].tolist(), [4.0, 5.0])
+
+  def test_empty(self):
+    for raw_data in (None, '', '[]', []):
+      self.assertEqual(decode_raw_data(raw_data)['times'].size, 0)
+    self.assertEqual(decode_raw_data(encode_raw_data([], []))['values'].size, 0)
+
+  def test_legacy_json_rows(self):
+    self.assertFalse(is_encoded(LEGACY))
+    decoded = decode_raw_data(LEGACY, 'Europe/Madrid')
+    # Legacy timestamps are in system time, one hour ahead of UTC in winter
+    self.assertEqual(decoded['times'].tolist(), [START_US, START_US + 10000000])
+    self.assertEqual(decoded['values'][0], 20.5)
+    self.assertTrue(np.isnan(decoded['values'][1]))
+    self.assertEqual(decoded['raw_values'].tolist(), [4.1, 4.2])
+
+  def test_rows_in_legacy_format(self):
+    times = np.array([START_US], dtype=np.int64)
+    rows = raw_data_rows(encode_raw_data(times, [20.5], [4.1]), 'Europe/Madrid')
+    self.assertEqual(rows, [{'timestamp': '2026-01-01 01:00:00', 'value': '20.5', 'raw_value': '4.1'}])
+
+  def test_unknown_codec(self):
+    with self.assertRaises(ValueError):
+      decode_raw_data({'codec': 'other', 'data': ''})
+
+class TestEncodeLogItemRawDataPatch(FrappeTestCase):
+  def test_only_legacy_rows_are_rewritten(self):
+    encoded = encode_raw_data(np.array([START_US], dtype=np.int64), [1.0])
+    rows = [
+      frappe._dict(name='ITEM-1', raw_data=encoded),
+      frappe._dict(name='ITEM-2', raw_data=LEGACY),
+      frappe._dict(name='ITEM-3', raw_data='not json')
+    ]
+    updates = {}
+
+    def sql(query, values=None, as_dict=False):
+      if query.lstrip().startswith('SELECT'):
+        return rows if values[0] == '' else []
+      updates[values[1]] = values[0]
+
+    with patch('frappe.db') as db, patch(
+      'pibiconnect.pibiconnect.raw_data_codec.get_system_timezone', return_value='Europe/Madrid'
+    ):
+      db.sql.side_effect = sql
+      encode_log_item_raw_data.execute()
+
+    self.assertEqual(list(updates), ['ITEM-2'])
+    decoded = decode_raw_data(updates['ITEM-2'])
+    self.assertEqual(decoded['times'].tolist(), [START_US, START_US + 10000000])
+    self.assertEqual(decoded['raw_values'].tolist(), [4.1, 4.2])
@@ -0,0 +1,59 @@
+import numpy as np
+
+from frappe.tests.utils import FrappeTestCase
+from pibiconnect.pibiconnect.span_table import CompiledSpan, SpanTable, parse_coefficients
+
+class TestCompiledSpan(FrappeTestCase):
+  def assertValues(self, actual, expected):
+    np.testing.assert_allclose(actual, np.asarray(expected, dtype=np.float64))
+
+  def test_linear_0_10v(self):
+    span = CompiledSpan(lower_span=0, higher_span=100, span_factor=10)
+    self.assertTrue(span.active)
+    self.assertValues(span.apply([0, 2.5, 10]), [0, 25, 100])
+
+  def test_linear_4_20ma(self):
+    span = CompiledSpan(lower_span=-20, higher_span=60, span_factor=5, scale='4-20mA')
+    self.assertValues(span.apply([4, 12, 20]), [-20, 20, 60])
+    # Readings below the live zero are held at the lower span
+    self.assertValues(span.apply([0, 3.9]), [-20, -20])
+
+  def test_inactive_span_passes_values_through(self):
+    span = CompiledSpan()
+    self.assertFalse(span.active)
+    self.assertValues(span.apply([1.5, -2]), [1.5, -2])
+    # Piecewise spans need two points to interpolate
+    self.assertFalse(CompiledSpan(curve_type='Piecewise', points=[(0, 1)]).active)
+    self.assertFalse(CompiledSpan(curve_type='Polynomial').active)
+
+  def test_piecewise(self):
+    span = CompiledSpan(curve_type='Piecewise', points=[(10, 100), (0, 0), (5, 20)])
+    self.assertValues(span.apply([0, 2.5, 5, 7.5, 10]), [0, 10, 20, 60, 100])
+    # Held at the first and last points
+    self.assertValues(span.apply([-1, 11]), [0, 100])
+
+  def test_polynomial(self):
+    # 1 + 2x + 3x^2, lowest degree first
+    span = CompiledSpan(curve_type='Polynomial', coefficients=[1, 2, 3])
+    self.assertValues(span.apply([0, 1, 2]), [1, 6, 17])
+
+  def test_parse_coefficients(self):
+    self.assertEqual(parse_coefficients(None), [])
+    self.assertEqual(parse_coefficients('1, 2.5;-3,'), [1.0, 2.5, -3.0])
+
+  def test_curves_for_the_dashboard(self):
+    table = SpanTable()
+    table._spans = {
+      ('DEV-1', 'level'): CompiledSpan(lower_span=-20, higher_span=60, span_factor=5, scale='4-20mA'),
+      ('DEV-1', 'temp'): CompiledSpan(),
+      ('DEV-2', 'level'): CompiledSpan(curve_type='Polynomial', coefficients=[1, 2])
+    }
+    table._by_device = {'DEV-1': {'level', 'temp'}, 'DEV-2': {'level'}}
+
+    # Inactive spans are left out, readings pass through them unchanged
+    curves = table.curves('DEV-1')
+    self.assertEqual(list(curves), ['level'])
+    self.assertEqual(curves['level']['input_min'], 4.0)
+    self.assertEqual(curves['level']['span_factor'], 5)
+    self.assertEqual(table.curves('DEV-2')['level']['poly'], [2.0, 1.0])
+    self.assertEqual(table.curves('DEV-3'), {})